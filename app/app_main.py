@@ -1,5 +1,8 @@
-import app_utils as au
+# pool workers started with spawn or forkserver re-import this script as __mp_main__.
+# The app is only imported and rendered when streamlit runs the script, so workers never load streamlit
+if __name__ == "__main__":
+    import app_utils as au
 
-au.configure_page()
-au.create_sidebar()
-au.page_handler()
\ No newline at end of file
+    au.configure_page()
+    au.create_sidebar()
+    au.page_handler()
\ No newline at end of file
@@ -1,10 +1,18 @@
+import sqlite3
+from collections import OrderedDict
 from typing import List, Dict, Union
-from PyPDF2 import PdfReader
+import numpy as np
 import pandas as pd
 import streamlit as st
 from streamlit_option_menu import option_menu
-import yaml
+import constants as c
 import etl_utils as eu
+import extraction_utils as xu
+import ingestion_utils as ig
+import profiling_utils as pu
+import report_utils as rpu
+import rule_utils as ru
+import store_utils as su
 
 def configure_page():
     st.set_page_config(
@@ -46,65 +54,271 @@ def create_sidebar():
         )
         selected_page = map_selected_page(selected_page)
         st.session_state["selected_page"] = selected_page
+        if "ingestion_job" in st.session_state:
+            render_ingestion_progress()
+        render_diagnostics_panel()
 
-def assign_vec(statements_df:pd.DataFrame):
+def render_diagnostics_panel():
+    """Sidebar panel that turns on stage timings and profiling, and shows what they recorded since the last reset."""
+    with st.expander("Diagnostics"):
+        enabled = st.checkbox("Record stage timings and counters", value=pu.is_enabled(), key="profiling_enabled", help=f"Timings are also logged as json lines. Set the {c.PROFILING_ENV_VAR} environment variable to 1 to enable this at startup.")
+        pu.set_enabled(enabled)
+        if not enabled:
+            return
+        st.selectbox("Profiler", options=["cProfile", "tracemalloc"], key="profiling_capture_kind")
+        st.button("Profile Next Action", on_click=request_profiling_capture, help="Profiles the next page render, or the next ingestion job if the next action is processing files. One capture per click.")
+        if ("profiling_capture_requested" in st.session_state) or ("profiling_capture_armed" in st.session_state):
+            st.caption("The next action will be profiled.")
+        stats_list = pu.get_stats()
+        if stats_list:
+            st.dataframe(pd.DataFrame(stats_list), hide_index=True, use_container_width=True)
+        else:
+            st.caption("No stages have run since instrumentation was enabled.")
+        for label, report_str in pu.get_capture_reports().items():
+            st.markdown(f"**{label}**")
+            st.code(report_str, language=None)
+        st.button("Reset Diagnostics", on_click=reset_diagnostics)
+
+def request_profiling_capture():
+    # the click itself triggers a run, so the capture is armed once that run is over and taken by the run after it
+    st.session_state["profiling_capture_requested"] = True
+
+def take_profiling_capture():
+    """Return the armed capture kind, or None, and disarm it."""
+    return st.session_state.pop("profiling_capture_armed", None)
+
+def reset_diagnostics():
+    pu.reset_stats()
+    st.session_state.pop("rule_timings", None)
+
+def get_uploaded_rules():
+    """Read the uploaded YAML file into (yaml_file_dict, vec_config_dict_key), or None when no file was uploaded."""
     try:
         yaml_uploadedfile_obj = st.session_state["vec_config"]
-        yaml_file_dict = yaml.safe_load(yaml_uploadedfile_obj.read())
+        return ru.load_rules_yaml(yaml_uploadedfile_obj.getvalue())
     except (KeyError, AttributeError) as ke_ae:
-        st.warning("No yaml vendor name and expense category configuration file was uploaded. If this is correct, ignore this warning.")
-        return statements_df
-    
+        return None
+
+def assign_vec(statements_df:pd.DataFrame, uploaded_rules:tuple):
+    yaml_file_dict, vec_config_dict_key = uploaded_rules
     # must store dictionary object into session_state. streamlit UploadedFile object cannot be kep in session state 
-    vec_config_dict_key = [*yaml_file_dict.keys()][0]
+    set_session_rules(yaml_file_dict, vec_config_dict_key)
+    write_store(su.save_rules, yaml_file_dict, vec_config_dict_key)
+    yaml_file_list = yaml_file_dict[vec_config_dict_key]
+
+    statements_df = apply_rule_list(statements_df, yaml_file_list)
+    return statements_df
+
+def set_session_rules(yaml_file_dict:Dict[str, List[Dict[str, Union[str, bool]]]], vec_config_dict_key:str):
+    """Make yaml_file_dict the session rules and index them by rule key."""
     st.session_state["vec_config_dict_key"] = vec_config_dict_key
     st.session_state["vec_config_dict"] = yaml_file_dict
-    yaml_file_list = yaml_file_dict[vec_config_dict_key]
+    st.session_state["vec_rule_index"] = ru.build_rule_index(yaml_file_dict[vec_config_dict_key])
+    st.session_state.pop("vec_rule_yaml_list", None)
 
-    for i, rule_dict in enumerate(yaml_file_list):
-        description = rule_dict["description"]
-        vendor = rule_dict["vendor"]
-        expense_category = rule_dict["expense_category"]
-        exact_match = rule_dict["exact_match"]
-        columns_to_change = ["Vendor_Name", "Expense_Category", "Rule_Applied_str", "Rule_Applied_bool"]
-        if exact_match:
-            condition = (statements_df["Description"]==description)
-            statements_df.loc[condition, columns_to_change] = [vendor, expense_category, str(yaml_file_list[i]), True]
-        else:
-            condition = ((statements_df["Description"].str.strip().str.contains(description, case=rule_dict["case_sensitive"], regex=rule_dict["is_regex"])) & (statements_df["Rule_Applied_bool"]==False))
-            statements_df.loc[condition, columns_to_change] = [vendor, expense_category, str(yaml_file_list[i]), True]
+def get_rule_yaml_list(rule_list:List[Dict[str, Union[str, bool]]]):
+    """YAML text of each session rule, dumped once and then kept in step with rule edits by add_new_rules."""
+    if not ("vec_rule_yaml_list" in st.session_state):
+        st.session_state["vec_rule_yaml_list"] = [ru.dump_rule_yaml(rule_dict) for rule_dict in rule_list]
+    return st.session_state["vec_rule_yaml_list"]
+
+def apply_rule_list(statements_df:pd.DataFrame, rule_list:List[Dict[str, Union[str, bool]]]):
+    with pu.stage_timer("assign_vec") as stage:
+        compiled_rules = ru.compile_rules(rule_list)
+        # regex timings cost a clock read per evaluation, so they are only recorded with diagnostics enabled
+        rule_timing_dict = st.session_state.setdefault("rule_timings", {}) if pu.is_enabled() else None
+        statements_df = ru.apply_rules(statements_df, compiled_rules, rule_timing_dict)
+        stage.count("rows", len(statements_df))
+        stage.count("rules", len(rule_list))
+        stage.count("matched_rows", int(statements_df["Rule_Applied_bool"].sum()))
     return statements_df
 
-def process_files():
-    statements_list = []
-    if "e_statements" in st.session_state:
-        file_list = st.session_state.e_statements
-        if file_list:
-            for file in file_list:
-                # Extract text from PDF
-                reader = PdfReader(file)
-                pdf_text = ""
-                for page in reader.pages:
-                    pdf_text += page.extract_text()
-                statement_df = eu.get_statement_df(pdf_text)
-                statements_list.append(statement_df)
-        else:
-            # will be entered in file_list = []
-            st.error("No files uploaded.")
-    else:
-        st.markdown("e_statements does not exist as accessible variable in session state")
+def set_statements_df(statements_df:pd.DataFrame):
+    """Store the session transactions and bump their version, which invalidates every frame derived from them."""
+    st.session_state["statements_df"] = statements_df
+    st.session_state["statements_version"] = st.session_state.get("statements_version", 0) + 1
+
+def write_store(store_function, *args):
+    """Run a store write, reporting a failure instead of raising it."""
     try:
-        all_statements_df = pd.concat(objs=statements_list, ignore_index=True)
-        all_statements_df = all_statements_df[["Transaction_Date", "Transaction_Type", "Description", "Amount"]].reset_index(drop=True)
-        all_statements_df["Vendor_Name"] = ""
-        all_statements_df["Expense_Category"] = ""
-        all_statements_df["Rule_Applied_str"] = ""
-        all_statements_df["Rule_Applied_bool"] = False
-        all_statements_df = assign_vec(all_statements_df)
-        st.session_state["statements_df"] = all_statements_df
-        st.success("Processed files successfully. Navigate to the customization of vendor name and expense categories.")
-    except ValueError as ve:
-        pass
+        store_function(*args)
+    except (sqlite3.Error, OSError) as e:
+        st.warning(f"Could not save transactions to the local store. ERROR TYPE: {type(e)} ERROR STR: {e}")
+
+def load_stored_session():
+    """Restore transactions and rules saved by a previous session."""
+    try:
+        statements_df = su.load_transactions()
+        yaml_file_dict, vec_config_dict_key = su.load_rules()
+    except (sqlite3.Error, OSError) as e:
+        st.warning(f"Could not load transactions from the local store. ERROR TYPE: {type(e)} ERROR STR: {e}")
+        return
+    if statements_df is None:
+        return
+    if yaml_file_dict is not None:
+        set_session_rules(yaml_file_dict, vec_config_dict_key)
+    set_statements_df(statements_df)
+
+def get_versioned_value(cache_key:str, build_function, *args):
+    """Return a session cached value, rebuilt when the statements_df version changes."""
+    version = st.session_state.get("statements_version", 0)
+    cached = st.session_state.get(cache_key)
+    if (cached is None) or (cached[0]!=version):
+        cached = (version, build_function(*args))
+        st.session_state[cache_key] = cached
+    return cached[1]
+
+def get_lru_value(cache_name:str, cache_key:tuple, max_entries:int, stage_name:str, build_function, df:pd.DataFrame, *args):
+    """Return build_function(df, *args) from a least recently used session cache."""
+    cache = st.session_state.setdefault(cache_name, OrderedDict())
+    cache_key = (st.session_state.get("statements_version", 0), *cache_key)
+    if cache_key in cache:
+        cache.move_to_end(cache_key)
+        pu.count(stage_name, "cache_hits")
+        return cache[cache_key]
+    with pu.stage_timer(stage_name) as stage:
+        value = build_function(df, *args)
+        stage.count("rows", len(df))
+    cache[cache_key] = value
+    while len(cache)>max_entries:
+        cache.popitem(last=False)
+    return value
+
+def classify_new_statements(new_statements_df:pd.DataFrame, uploaded_rules:tuple=None):
+    """Categorize new transactions with the session rules, or the uploaded YAML."""
+    if "vec_config_dict" in st.session_state:
+        yaml_file_dict = st.session_state["vec_config_dict"]
+        return apply_rule_list(new_statements_df, yaml_file_dict[st.session_state["vec_config_dict_key"]])
+    if uploaded_rules is not None:
+        return assign_vec(new_statements_df, uploaded_rules)
+    return new_statements_df
+
+def update_period_indexes(previous_version:int, offset:int, new_statements_df:pd.DataFrame):
+    """Extend the cached period indexes with appended rows and keep the aggregates of periods without new rows."""
+    version = st.session_state["statements_version"]
+    touched_keys = set()
+    for freq in ["M", "Q"]:
+        new_period_index = rpu.build_period_index(new_statements_df, freq)
+        touched_keys.update((freq, period_label) for period_label in new_period_index)
+        cached = st.session_state.get(f"period_index_{freq}")
+        if (cached is not None) and (cached[0]==previous_version):
+            st.session_state[f"period_index_{freq}"] = (version, rpu.merge_period_index(cached[1], new_period_index, offset))
+
+    cache = st.session_state.get("period_aggregates", OrderedDict())
+    for cache_key in [*cache]:
+        if (cache_key[0]==previous_version) and not (cache_key[1:] in touched_keys):
+            cache[(version, *cache_key[1:])] = cache.pop(cache_key)
+
+def update_transaction_key_set(previous_version:int, new_statements_df:pd.DataFrame, new_key_array:np.ndarray=None):
+    """Carry the cached transaction keys over to the new statements_df version, hashing only the appended rows."""
+    cached = st.session_state.get("transaction_key_set")
+    if (cached is None) or (cached[0]!=previous_version):
+        return
+    if new_key_array is None:
+        new_key_array = eu.get_transaction_keys(new_statements_df)
+    cached[1].update(new_key_array.tolist())
+    st.session_state["transaction_key_set"] = (st.session_state["statements_version"], cached[1])
+
+def append_statements(new_statements_df:pd.DataFrame, classify:bool=True, uploaded_rules:tuple=None, drop_existing:bool=True)->int:
+    """Add new transactions to statements_df and return how many were added."""
+    statements_df = st.session_state["statements_df"]
+    new_key_array = None
+    if drop_existing:
+        existing_key_set = get_versioned_value("transaction_key_set", eu.get_transaction_key_set, statements_df)
+        new_statements_df, new_key_array = eu.drop_existing_transactions(existing_key_set, new_statements_df)
+    if new_statements_df.empty:
+        return 0
+    if classify:
+        new_statements_df = classify_new_statements(new_statements_df, uploaded_rules)
+    previous_version = st.session_state.get("statements_version", 0)
+    write_store(su.append_transactions, new_statements_df, len(statements_df))
+    set_statements_df(eu.concat_statements([statements_df, new_statements_df]))
+    update_period_indexes(previous_version, len(statements_df), new_statements_df)
+    update_transaction_key_set(previous_version, new_statements_df, new_key_array)
+    return len(new_statements_df)
+
+def replace_statements(statements_df:pd.DataFrame, uploaded_rules:tuple=None)->int:
+    if uploaded_rules is not None:
+        statements_df = assign_vec(statements_df, uploaded_rules)
+    write_store(su.replace_transactions, statements_df)
+    set_statements_df(statements_df)
+    return len(statements_df)
+
+def start_ingestion():
+    """Start parsing the uploaded e-statements on a background thread."""
+    file_list = st.session_state.get("e_statements")
+    if not file_list:
+        st.error("No files uploaded.")
+        return
+    uploaded_rules = get_uploaded_rules()
+    append = bool(st.session_state.get("append_statements")) and ("statements_df" in st.session_state)
+    if (uploaded_rules is None) and not (append and ("vec_config_dict" in st.session_state)):
+        st.warning("No yaml vendor name and expense category configuration file was uploaded. If this is correct, ignore this warning.")
+    job = ig.start_job(
+        [file.getvalue() for file in file_list],
+        [file.name for file in file_list],
+        st.session_state.get("ingestion_workers", c.INGESTION_MAX_WORKERS),
+        st.session_state.get("extraction_engine", c.DEFAULT_EXTRACTION_ENGINE),
+        st.session_state.get("stop_after_sections", False),
+        take_profiling_capture()
+        )
+    # fields below are only read and written by the script thread
+    job.update({"append": append, "classify": append or (uploaded_rules is not None), "uploaded_rules": uploaded_rules, "num_added": 0, "num_batches": 0})
+    st.session_state["ingestion_job"] = job
+    st.session_state.pop("ingestion_summary", None)
+
+def merge_parsed_statements(job:dict)->bool:
+    """Publish statements parsed since the last poll and return whether statements_df changed."""
+    statement_list = ig.take_parsed_statements(job)
+    if not statement_list:
+        return False
+    with pu.stage_timer("merge_parsed_statements") as stage:
+        new_statements_df = eu.build_statements_df(statement_list)
+        stage.count("statements", len(statement_list))
+        stage.count("rows", len(new_statements_df))
+        # how statements split into poll batches depends on timing, so only append jobs deduplicate, which gives the same rows for any split
+        if job["append"]:
+            job["num_added"] += append_statements(new_statements_df, job["classify"], job["uploaded_rules"])
+        elif job["num_batches"]:
+            job["num_added"] += append_statements(new_statements_df, job["classify"], job["uploaded_rules"], drop_existing=False)
+        else:
+            job["num_added"] += replace_statements(new_statements_df, job["uploaded_rules"])
+        job["num_batches"] += 1
+    return True
+
+def cancel_ingestion():
+    ig.cancel_job(st.session_state["ingestion_job"])
+
+@st.fragment(run_every=c.INGESTION_POLL_SECONDS)
+def render_ingestion_progress():
+    """Poll the ingestion job and show its progress in the sidebar."""
+    job = st.session_state.get("ingestion_job")
+    if job is None:
+        return
+    # read the status before taking statements, so a finished job has nothing left to publish
+    num_done, num_files, status, failure_list = ig.get_progress(job)
+    statements_changed = merge_parsed_statements(job)
+    if status!="running":
+        st.session_state["ingestion_summary"] = (num_done, num_files, status, failure_list, job["num_added"])
+        del st.session_state["ingestion_job"]
+        st.rerun(scope="app")
+    if statements_changed:
+        st.rerun(scope="app")
+    st.progress(num_done/num_files, text=f"Processed {num_done} of {num_files} e-statements")
+    st.button("Cancel Processing", on_click=cancel_ingestion, disabled=job["cancel_event"].is_set())
+
+def render_ingestion_summary():
+    if not ("ingestion_summary" in st.session_state):
+        return
+    num_done, num_files, status, failure_list, num_added = st.session_state["ingestion_summary"]
+    for file_name, error_str in failure_list:
+        st.error(f"Could not parse {file_name}. {error_str}")
+    if status=="cancelled":
+        st.warning(f"Processing was cancelled after {num_done} of {num_files} e-statements. Transactions from those e-statements were kept.")
+    if num_added:
+        st.success(f"Added {num_added} transactions. Navigate to the customization of vendor name and expense categories.")
+    elif num_done>len(failure_list):
+        st.info("Every uploaded transaction was already processed. No transactions were added.")
 
 def render_data_intake():
     st.file_uploader(
@@ -119,77 +333,144 @@ def render_data_intake():
         accept_multiple_files=False,
         key="vec_config"
     )
-    st.button(label="Process Files", on_click=process_files)
+    st.number_input(
+        "How many worker processes should parse e-statements in parallel?",
+        min_value=1,
+        max_value=c.INGESTION_MAX_WORKERS*4,
+        value=c.INGESTION_MAX_WORKERS,
+        step=1,
+        key="ingestion_workers"
+    )
+    st.selectbox(
+        "Which engine should extract text from e-statements? PyPDF2 is always available. pypdfium2 and pymupdf are faster and are listed once installed.",
+        options=xu.get_available_engines(),
+        key="extraction_engine"
+    )
+    st.checkbox(
+        "Stop reading each e-statement once its transaction sections end. Pages after the interest charges section are not extracted.",
+        key="stop_after_sections"
+    )
+    st.checkbox(
+        "Append these e-statements to the statements already processed. Transactions that were already processed are skipped, and only new transactions are categorized with the current rules.",
+        key="append_statements"
+    )
+    st.button(label="Process Files", on_click=start_ingestion, disabled="ingestion_job" in st.session_state)
+    st.button(label="Clear Saved Transactions", on_click=clear_saved_transactions, help="Processed transactions and rules are saved on this computer so they reload after a browser refresh. This deletes them.")
+    render_ingestion_summary()
+
+def clear_saved_transactions():
+    if "ingestion_job" in st.session_state:
+        ig.cancel_job(st.session_state.pop("ingestion_job"))
+    write_store(su.clear_store)
+    # statements_version is kept, so caches keyed on it are never served to the next dataset
+    for key in ["statements_df", "vec_config_dict", "vec_config_dict_key", "vec_rule_index", "vec_rule_yaml_list", "rule_timings"]:
+        st.session_state.pop(key, None)
+    st.success("Saved transactions and rules were deleted.")
 
 def get_vec_changes(df:pd.DataFrame, edited_df:pd.DataFrame):
     has_vec_condition = (df["Vendor_Name"]!="") & (df["Expense_Category"]!="")
-    df_w_vec = df[has_vec_condition]
-
     edited_has_vec_condition = (edited_df["Vendor_Name"]!="") & (edited_df["Expense_Category"]!="")
-    edited_df_w_vec = edited_df[edited_has_vec_condition]
+    new_vec_index = edited_df.index[edited_has_vec_condition].difference(df.index[has_vec_condition])
 
     rules_created_indices = st.session_state["rules_created_indices"]
-
-    if len(df_w_vec)==len(edited_df_w_vec):
-        change_indices = []
-    else:
-        change_indices = [index for index in edited_df_w_vec.index if not (index in df_w_vec.index) and not (index in rules_created_indices)]
-        rules_created_indices.extend(change_indices)
-        st.session_state["rules_created_indices"] = rules_created_indices
+    change_indices = [index for index in new_vec_index if not (index in rules_created_indices)]
+    rules_created_indices.update(change_indices)
     return change_indices
 
 def add_new_rules(yaml_file_dict:Dict[str, List[Dict[str, Union[str, bool]]]], edited_dvec_df:pd.DataFrame):
+    """Add an exact match rule per edited description, replacing an existing rule for the same description.
+    Returns the YAML text of every rule and {description: rule position}."""
     if yaml_file_dict:
         vec_config_dict_key = st.session_state["vec_config_dict_key"]
     else:
         vec_config_dict_key = "vec_items"
         yaml_file_dict = {vec_config_dict_key:[]}
+        # later statements appended to this session are categorized with these rules
+        set_session_rules(yaml_file_dict, vec_config_dict_key)
 
-    for i, row in edited_dvec_df.iterrows():
-        description = row["Description"]
-        vn = row["Vendor_Name"]
-        ec = row["Expense_Category"]
+    rule_list = yaml_file_dict[vec_config_dict_key]
+    rule_index = st.session_state["vec_rule_index"]
+    rule_yaml_list = get_rule_yaml_list(rule_list)
+    position_dict = {}
+    for description, vn, ec in edited_dvec_df[["Description", "Vendor_Name", "Expense_Category"]].itertuples(index=False, name=None):
         rule_dict = {"description":description, "vendor":vn, "expense_category":ec, "exact_match":True}
-        yaml_file_dict[vec_config_dict_key].append(rule_dict)
-    yaml_file_str = yaml.dump(yaml_file_dict)
-    return yaml_file_str
+        position = ru.upsert_rule(rule_list, rule_index, rule_dict)
+        if position==len(rule_yaml_list):
+            rule_yaml_list.append(ru.dump_rule_yaml(rule_dict))
+        else:
+            rule_yaml_list[position] = ru.dump_rule_yaml(rule_dict)
+        position_dict[description] = position
+    yaml_file_str = ru.join_rules_yaml(vec_config_dict_key, rule_yaml_list)
+    return yaml_file_str, position_dict
+
+def get_dvec_df(df:pd.DataFrame):
+    """One row per distinct description, taking vendor name and expense category from its first transaction."""
+    dvec_df = df[["Description", "Vendor_Name", "Expense_Category"]].drop_duplicates(subset=["Description"]).reset_index(drop=True)
+    # plain strings, since the data editor only offers existing values for categorical columns
+    dvec_df = dvec_df.astype(str)
+    return dvec_df.sort_values(by=["Description", "Vendor_Name", "Expense_Category"], ascending=[True, True, True])
 
 def render_customize_vendor_expense():
     df = st.session_state["statements_df"]
     st.markdown("""Assign vendors and expense categories to transaction descriptions. A transaction description must have both a Vendor and Expense_Category assigned. Once done, press the "Apply Changes" button below. An updated YAML file containing current and added rules will be available for download.""")
-    description_list = []
-    dvec_data_list = []
-    for i in range(0, len(df)):
-        description = df["Description"][i]
-        if not (description in description_list):
-            description_list.append(description)
-            data = {"Description": description, "Vendor_Name": df["Vendor_Name"][i], "Expense_Category": df["Expense_Category"][i]}
-            dvec_data_list.append(data)
-
-    dvec_df = pd.DataFrame(dvec_data_list).sort_values(by=["Description", "Vendor_Name", "Expense_Category"], ascending=[True, True, True])
+    dvec_df = get_versioned_value("dvec_df", get_dvec_df, df)
     
     edited_dvec_df = st.data_editor(data=dvec_df, use_container_width=True, hide_index=True)
     if st.button("Apply Changes"):
         changed_list = get_vec_changes(dvec_df, edited_dvec_df)
         if changed_list:
-            statements_df_w_new_rules = pd.merge(left=st.session_state["statements_df"], right=edited_dvec_df, on=["Description"], how="inner", suffixes=["_original", "_edited"])
-            statements_df = statements_df_w_new_rules[["Transaction_Date", "Transaction_Type", "Description", "Vendor_Name_edited", "Expense_Category_edited", "Amount"]]
-            statements_df = statements_df.rename({"Vendor_Name_edited":"Vendor_Name", "Expense_Category_edited":"Expense_Category"}, axis=1)
-            st.session_state["statements_df"] = statements_df
+            statements_df = st.session_state["statements_df"]
+            edited_vec_df = edited_dvec_df.set_index("Description")
+            statements_df["Vendor_Name"] = pd.Categorical(ru.map_description_values(statements_df["Description"], edited_vec_df["Vendor_Name"]))
+            statements_df["Expense_Category"] = pd.Categorical(ru.map_description_values(statements_df["Description"], edited_vec_df["Expense_Category"]))
+            edited_condition = (edited_dvec_df[["Vendor_Name", "Expense_Category"]]!=dvec_df[["Vendor_Name", "Expense_Category"]]).any(axis=1)
+            write_store(su.update_vendor_expense, edited_dvec_df[edited_condition])
+            set_statements_df(statements_df)
             try:
                 try:
                     yaml_file_dict = st.session_state["vec_config_dict"]
                 except KeyError as ke:
                     yaml_file_dict = {}
-                yaml_file_str = add_new_rules(yaml_file_dict, edited_dvec_df.loc[changed_list, :])
+                yaml_file_str, position_dict = add_new_rules(yaml_file_dict, edited_dvec_df.loc[changed_list, :])
+                rule_list = st.session_state["vec_config_dict"][st.session_state["vec_config_dict_key"]]
+                write_store(su.upsert_rules, [(position, rule_list[position]) for position in sorted(set(position_dict.values()))], st.session_state["vec_config_dict_key"])
+                set_rule_ids(statements_df, position_dict)
                 st.download_button(label="Download the available yaml file containing Vendor and Expense Category assignment configuration information. Use this new file in the future to maintain your iterative changes.", data=yaml_file_str, file_name="vendor_expense_category_config.yaml", icon=":material/download_for_offline:", use_container_width=True)
             except Exception as e:
                 st.markdown(str(st.session_state))
                 st.markdown(f"ERROR TYPE: {type(e)} ERROR {e}")
         else:
             st.warning("No changes were applied to the dataframe, so no new rules have been created.")
+    render_rule_stats(df)
+
+def set_rule_ids(statements_df:pd.DataFrame, position_dict:Dict[str, int]):
+    """Record the rules created on the customization page as the rules applied to the transactions of their descriptions."""
+    rule_id_array = ru.map_description_values(statements_df["Description"], pd.Series(position_dict, dtype=object))
+    created = pd.notna(rule_id_array)
+    statements_df["Rule_Id"] = np.where(created, rule_id_array, statements_df["Rule_Id"].to_numpy()).astype(np.int32)
+    statements_df["Rule_Applied_bool"] = statements_df["Rule_Applied_bool"].to_numpy() | created
+    write_store(su.update_rule_ids, [*position_dict.items()])
+
+def render_rule_stats(df:pd.DataFrame):
+    if not ("vec_config_dict" in st.session_state):
+        return
+    with st.expander("Rule hit counts"):
+        st.caption("Transactions and distinct descriptions categorized by each rule. Rules that categorize nothing can be pruned from the YAML file. Regex evaluations are counted and timed while diagnostics are enabled in the sidebar.")
+        rule_list = st.session_state["vec_config_dict"][st.session_state["vec_config_dict_key"]]
+        rule_stats_df = ru.get_rule_stats_df(rule_list, df, st.session_state.get("rule_timings", {}))
+        st.dataframe(rule_stats_df, hide_index=True, use_container_width=True, column_config={"Regex_Seconds": st.column_config.NumberColumn("Regex_Seconds", format="%.6f")})
     
-def render_filter_df_section(df:pd.DataFrame, key_info:tuple):
+def filter_period_df(df:pd.DataFrame, period_key:tuple, filter_args:tuple)->pd.DataFrame:
+    filter_arrays_dict = get_versioned_value("period_filter_arrays", dict)
+    if not (period_key in filter_arrays_dict):
+        filter_arrays_dict[period_key] = rpu.build_filter_arrays(df)
+    return rpu.filter_period(df, filter_arrays_dict[period_key], *filter_args)
+
+def get_filtered_df(df:pd.DataFrame, period_key:tuple, filter_args:tuple)->pd.DataFrame:
+    """Return the sorted, filtered transactions of one report period."""
+    return get_lru_value("filtered_tables", (*period_key, filter_args), c.FILTER_CACHE_MAX_ENTRIES, "filter_transactions", filter_period_df, df, period_key, filter_args)
+
+def render_filter_df_section(df:pd.DataFrame, key_info:tuple, period_key:tuple):
     td_y, td_mq = map(int, key_info)
     col1, col2 = st.columns(2)
 
@@ -212,19 +493,8 @@ def render_filter_df_section(df:pd.DataFrame, key_info:tuple):
         expense_category_list = df["Expense_Category"].unique()
         selected_expense_categories_list = st.multiselect(label="Which expense category transactions would you like to see?", options=expense_category_list, default=expense_category_list, key=f"multiselect_{td_y}_{td_mq}_1")
 
-    filtered_df = df.copy(deep=True).drop(labels=["Transaction_Type"], axis=1)
-
-    if min_td_bound and max_td_bound:
-        filtered_df = filtered_df[(filtered_df["Transaction_Date"].dt.date>=min_td_bound) & (filtered_df["Transaction_Date"].dt.date<=max_td_bound)]
-    if min_amount_bound and max_amount_bound:
-        filtered_df = filtered_df[(filtered_df["Amount"]>=min_amount_bound) & (filtered_df["Amount"]<=max_amount_bound)]
-    if selected_vendors_list:
-        filtered_df = filtered_df[filtered_df["Vendor_Name"].isin(selected_vendors_list)]
-    if selected_expense_categories_list:
-        filtered_df = filtered_df[filtered_df["Expense_Category"].isin(selected_expense_categories_list)]
-    
-    # highlight outliers by amount
-    sorted_df = filtered_df.sort_values(by=["Transaction_Date", "Description", "Vendor_Name", "Expense_Category", "Amount"], ascending=[True, True, True, True, False])
+    filter_args = (min_td_bound, max_td_bound, min_amount_bound, max_amount_bound, tuple(selected_vendors_list), tuple(selected_expense_categories_list))
+    sorted_df = get_filtered_df(df, period_key, filter_args)
     sorted_df = sorted_df.rename({"Transaction_Date":"Transaction Date", "Vendor_Name":"Vendor Name", "Expense_Category": "Expense Category"}, axis=1)
     column_config = {
         "Transaction Date":st.column_config.DateColumn("Transaction Date", format="YYYY-MM-DD"),
@@ -232,11 +502,9 @@ def render_filter_df_section(df:pd.DataFrame, key_info:tuple):
         }
     st.dataframe(sorted_df[["Transaction Date", "Description", "Amount", "Vendor Name", "Expense Category"]], use_container_width=True, hide_index=True, selection_mode=["multi-row", "multi-column"], column_config=column_config)
 
-def render_top_N_t(df:pd.DataFrame, n:int):
+def render_top_N_t(top_n_df:pd.DataFrame, n:int):
     """Display the top N transaction descriptions by amount."""
-    sorted_df = df.sort_values(by=["Amount"], ascending=False).reset_index(drop=True)
-    top_n_df = sorted_df.iloc[0:n, :]
-    num_columns = min(n, len(df))
+    num_columns = min(n, len(top_n_df))
     column_list = st.columns(num_columns)
     for i, column in enumerate(column_list):
         with column:
@@ -246,12 +514,9 @@ def render_top_N_t(df:pd.DataFrame, n:int):
             st.write(f"**Description Name:** {description}")
             st.write(f"**Total Amount:** ${amount:,.2f}")
 
-def render_top_N_v(df:pd.DataFrame, n:int):
+def render_top_N_v(top_n_df:pd.DataFrame, n:int):
     """Display the top N vendors based on the total transaction amount."""
-    grouped_df = df[["Vendor_Name", "Expense_Category", "Amount"]].groupby(by=["Vendor_Name", "Expense_Category"]).sum()
-    sorted_df = grouped_df.sort_values(by=["Amount"], ascending=False).reset_index()
-    top_n_df = sorted_df.iloc[0:n, :].reset_index()
-    num_columns = min(n, len(grouped_df))
+    num_columns = min(n, len(top_n_df))
     column_list = st.columns(num_columns)
     for i, column in enumerate(column_list):
         with column:
@@ -263,12 +528,9 @@ def render_top_N_v(df:pd.DataFrame, n:int):
             st.write(f"**Expense Category:** {expense_category}")
             st.write(f"**Total Amount:** ${amount:,.2f}")
 
-def render_top_N_ec(df:pd.DataFrame, n:int):
+def render_top_N_ec(top_n_df:pd.DataFrame, n:int):
     """Display the top N expense categories based on the total transaction amount."""
-    grouped_df = df[["Expense_Category", "Amount"]].groupby(by=["Expense_Category"]).sum()
-    sorted_df = grouped_df.sort_values(by=["Amount"], ascending=False).reset_index()
-    top_n_df = sorted_df.iloc[0:n, :]
-    num_columns = min(n, len(grouped_df))
+    num_columns = min(n, len(top_n_df))
     column_list = st.columns(num_columns)
     for i, column in enumerate(column_list):
         with column:
@@ -278,16 +540,21 @@ def render_top_N_ec(df:pd.DataFrame, n:int):
             st.write(f"**Expense Category:** {expense_category}")
             st.write(f"**Total Amount:** ${amount:,.2f}")
 
-def render_insights(df:pd.DataFrame):
+def get_period_aggregates(df:pd.DataFrame, period_key:tuple)->Dict[str, object]:
+    """Return the aggregates of one report period."""
+    return get_lru_value("period_aggregates", period_key, c.AGGREGATE_CACHE_MAX_ENTRIES, "period_aggregates", rpu.build_period_aggregates, df)
+
+def render_insights(df:pd.DataFrame, period_key:tuple):
     try:
         year = [*df["Transaction_Date"].dt.year][0]
         month = [*df["Transaction_Date"].dt.month][0]
+        aggregates = get_period_aggregates(df, period_key)
         # total spent
         col1, col2, col3, col4 = st.columns(4)
         num_records_options = [1, 3, 5, 10]
 
         with col1:
-            total_spent = sum(df["Amount"])
+            total_spent = aggregates["total_spent"]
             st.markdown("Total amount of money spent")
             st.markdown(total_spent)
         with col2:
@@ -301,89 +568,67 @@ def render_insights(df:pd.DataFrame):
             ec_n =st.selectbox(label="How many top expense category insights would you like to see?", options=num_records_options, key=(key_str), index=1)
         
         # top three individual transactions
-        render_top_N_t(df, t_n)
+        render_top_N_t(aggregates["top_transactions_df"], t_n)
         # top three vendors
-        render_top_N_v(df, v_n)
+        render_top_N_v(aggregates["top_vendors_df"], v_n)
         # top three expense categories
-        render_top_N_ec(df, ec_n)
+        render_top_N_ec(aggregates["top_expense_categories_df"], ec_n)
         # filterable dataframe
-        render_filter_df_section(df, (year, month))
+        render_filter_df_section(df, (year, month), period_key)
     except Exception as e:
         exception_str = f"ERROR TYPE: {type(e)} ERROR STR: {e}"
         st.markdown(exception_str)
         st.dataframe(df)
 
-def get_year_month_combos(df:pd.DataFrame):
-    ym_list = []
-    for i in range(0, len(df)):
-        try:
-            ymd_value = df["Transaction_Date"][i]
-            mv = str(ymd_value.month)
-            yv = str(ymd_value.year)
-            ym_value = yv + "/" + (mv if len(mv)==2 else "0" + mv)
-            if not (ym_value in ym_list):
-                ym_list.append(ym_value)
-        except Exception as e:
-            st.markdown(f"FUNCTION: get_year_month_combos ERROR TYPE{type(e)} ERRRO STR: {e} VALUE: {ymd_value}")
-    return sorted(ym_list)
+def render_period_tabs(freq:str):
+    df = st.session_state["statements_df"]
+    period_index = get_versioned_value(f"period_index_{freq}", rpu.build_period_index, df, freq)
+    if not period_index:
+        st.warning("There are no debit transactions to report on.")
+        return
+    tabs_list = [*period_index]
+    show_all_periods = st.toggle("Show every period in tabs", key=f"show_all_periods_{freq}", help="Every period is rendered on each interaction, which slows down as history grows. By default only the selected period is rendered.")
+    with pu.stage_timer("render_report") as stage:
+        if show_all_periods:
+            tab_objects = st.tabs(tabs_list)
+            for tab, period_label in zip(tab_objects, tabs_list):
+                with tab:
+                    render_period(df, period_index, freq, period_label)
+            stage.count("periods", len(tabs_list))
+        else:
+            period_label = st.selectbox("Which period would you like to see?", options=tabs_list, index=len(tabs_list) - 1, key=f"selected_period_{freq}")
+            render_period(df, period_index, freq, period_label)
+            stage.count("periods", 1)
+
+def render_period(df:pd.DataFrame, period_index:dict, freq:str, period_label:str):
+    # the period index holds the row positions of each period's debit transactions
+    job_df = df.iloc[period_index[period_label]]
+    render_insights(job_df, (freq, period_label))
 
 def render_monthly():
-    df = st.session_state["statements_df"]
-    df['Transaction_Date'] = pd.to_datetime(df['Transaction_Date'], errors='coerce')
-    tabs_list = get_year_month_combos(df) 
-    tab_objects = st.tabs(tabs_list)
-    for tab, year_month in zip(tab_objects, tabs_list):
-        with tab:
-            # Extract year and month from the tab's label
-            yv, mv = map(int, year_month.split("/"))
-            debit_condition = (df["Transaction_Type"]=="Debit")
-            year_condition = (df['Transaction_Date'].dt.year==yv)
-            month_condition = (df['Transaction_Date'].dt.month==mv)
-            all_conditions = debit_condition & year_condition & month_condition
-            # Filter df based on year and month
-            job_df = df[all_conditions]
-            render_insights(job_df)
-
-def get_year_quarter_combos(df:pd.DataFrame):
-    yq_list = []
-    for i in range(0, len(df)):
-        ymd_value = df["Transaction_Date"][i]
-        qv = str(ymd_value.quarter)
-        yv = str(ymd_value.year)
-        yq_value = yv + "/" + (qv if len(qv)==2 else "0" + qv)
-        if not (yq_value in yq_list):
-            yq_list.append(yq_value)
-    return sorted(yq_list)
+    render_period_tabs("M")
 
 def render_quarterly():
-    df = st.session_state["statements_df"]
-    tabs_list = get_year_quarter_combos(df) 
-    tab_objects = st.tabs(tabs_list)
-    for tab, year_quarter in zip(tab_objects, tabs_list):
-        with tab:
-            # Extract year and month from the tab's label
-            yv, qr = map(int, year_quarter.split("/"))
-            debit_condition = (df["Transaction_Type"]=="Debit")
-            year_condition = (df['Transaction_Date'].dt.year == yv)
-            month_condition = (df['Transaction_Date'].dt.quarter == qr)
-            all_conditions = debit_condition & year_condition & month_condition
-            # Filter df based on year and month
-            job_df = df[all_conditions]
-            render_insights(job_df)
+    render_period_tabs("Q")
 
 def page_handler():
     selected_page = st.session_state["selected_page"]
 
     if not ("rules_created_indices" in st.session_state):
-        st.session_state["rules_created_indices"] = []
+        st.session_state["rules_created_indices"] = set()
+    if not ("statements_df" in st.session_state):
+        load_stored_session()
     try:
-        if selected_page=="render_data_intake":
-            render_data_intake()
-        elif selected_page=="render_customize_vendor_expense":
-            render_customize_vendor_expense()
-        elif selected_page=="render_mothly":
-            render_monthly()
-        elif selected_page=="render_quarterly":
-            render_quarterly()
+        with pu.capture(selected_page, take_profiling_capture()):
+            if selected_page=="render_data_intake":
+                render_data_intake()
+            elif selected_page=="render_customize_vendor_expense":
+                render_customize_vendor_expense()
+            elif selected_page=="render_mothly":
+                render_monthly()
+            elif selected_page=="render_quarterly":
+                render_quarterly()
     except KeyError as ke:
-        st.error("Did you upload financial statements? If not, navigate to page 'Configure Date Intake' to upload your e-statements and your vendor/expense category mappings.")
\ No newline at end of file
+        st.error("Did you upload financial statements? If not, navigate to page 'Configure Date Intake' to upload your e-statements and your vendor/expense category mappings.")
+    if st.session_state.pop("profiling_capture_requested", False):
+        st.session_state["profiling_capture_armed"] = st.session_state.get("profiling_capture_kind", "cProfile")
@@ -0,0 +1,99 @@
+# standard library
+import hashlib
+import os
+from functools import lru_cache
+from typing import Optional
+# suplementary packages
+import pandas as pd
+# custom module(s)
+import constants as c
+import profiling_utils as pu
+
+CACHE_FILE_EXTENSION = ".parquet"
+
+@lru_cache(maxsize=1)
+def get_parser_fingerprint()->str:
+    """Hash the parser version and every parsing pattern in constants, so cached statements are invalidated when either changes."""
+    hasher = hashlib.sha256(str(c.PARSER_VERSION).encode("utf-8"))
+    for name in sorted(vars(c)):
+        value = getattr(c, name)
+        if name.endswith(("_PATTERN", "_STR")) and isinstance(value, str):
+            hasher.update(f"{name}={value}".encode("utf-8"))
+    hasher.update(repr(c.column_tuple).encode("utf-8"))
+    return hasher.hexdigest()[:16]
+
+def get_file_digest(file_bytes:bytes, extraction_key:str="")->str:
+    """Hash the file contents. A non default extraction_key (engine and options) is mixed in, since it can change the parsed output."""
+    hasher = hashlib.sha256(file_bytes)
+    if extraction_key:
+        hasher.update(extraction_key.encode("utf-8"))
+    return hasher.hexdigest()
+
+def get_cache_path(file_digest:str, cache_dir:str=c.STATEMENT_CACHE_DIR)->str:
+    file_name = f"{file_digest}_{get_parser_fingerprint()}{CACHE_FILE_EXTENSION}"
+    return os.path.join(cache_dir, file_name)
+
+def load_cached_statement(file_digest:str, cache_dir:str=c.STATEMENT_CACHE_DIR)->Optional[pd.DataFrame]:
+    cache_path = get_cache_path(file_digest, cache_dir)
+    if not os.path.exists(cache_path):
+        pu.count("statement_cache", "misses")
+        return None
+    try:
+        statement_df = pd.read_parquet(cache_path)
+        # refresh the access time so the entry counts as recently used for eviction
+        os.utime(cache_path)
+    except Exception as e:
+        # a corrupt or partially written entry is treated as a miss and removed
+        print(f"FUNCTION: load_cached_statement ERROR TYPE: {type(e)} ERROR STR: {e}")
+        remove_cache_file(cache_path)
+        pu.count("statement_cache", "misses")
+        return None
+    pu.count("statement_cache", "hits")
+    return statement_df
+
+def store_cached_statement(file_digest:str, statement_df:pd.DataFrame, cache_dir:str=c.STATEMENT_CACHE_DIR, max_bytes:int=c.STATEMENT_CACHE_MAX_BYTES):
+    cache_path = get_cache_path(file_digest, cache_dir)
+    tmp_path = cache_path + ".tmp"
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        statement_df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, cache_path)
+    except Exception as e:
+        # caching is best effort; parsing results are still returned to the caller
+        print(f"FUNCTION: store_cached_statement ERROR TYPE: {type(e)} ERROR STR: {e}")
+        remove_cache_file(tmp_path)
+        return
+    evict_cache_entries(cache_dir, max_bytes)
+
+def remove_cache_file(cache_path:str):
+    try:
+        os.remove(cache_path)
+    except OSError:
+        pass
+
+def evict_cache_entries(cache_dir:str=c.STATEMENT_CACHE_DIR, max_bytes:int=c.STATEMENT_CACHE_MAX_BYTES):
+    """Remove entries from a previous parser fingerprint, then least recently used entries until the cache fits in max_bytes."""
+    current_suffix = f"_{get_parser_fingerprint()}{CACHE_FILE_EXTENSION}"
+    entries = []
+    try:
+        dir_entries = list(os.scandir(cache_dir))
+    except OSError:
+        return
+    for dir_entry in dir_entries:
+        if not dir_entry.name.endswith(CACHE_FILE_EXTENSION):
+            continue
+        if not dir_entry.name.endswith(current_suffix):
+            remove_cache_file(dir_entry.path)
+            continue
+        try:
+            stat_result = dir_entry.stat()
+        except OSError:
+            continue
+        entries.append((stat_result.st_mtime, stat_result.st_size, dir_entry.path))
+
+    total_bytes = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total_bytes <= max_bytes:
+            break
+        remove_cache_file(path)
+        total_bytes -= size
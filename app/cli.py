@@ -0,0 +1,109 @@
+# standard library
+import argparse
+import glob
+import os
+import sys
+from functools import partial
+from typing import Dict, Optional
+# suplementary packages
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+# custom module(s)
+import constants as c
+import etl_utils as eu
+import extraction_utils as xu
+import profiling_utils as pu
+import rule_utils as ru
+
+OUTPUT_STRING_COLUMNS = ["Transaction_Type", "Description", "Reference_Number", "Statement_Period", "Vendor_Name", "Expense_Category"]
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Parse and categorize Bank of America credit card e-statements in bulk.")
+    parser.add_argument("statement_dir", help="Directory containing PDF e-statements. Subdirectories are searched as well.")
+    parser.add_argument("--rules", help="YAML vendor name and expense category configuration file.")
+    parser.add_argument("--output", required=True, help="Output file. The format is chosen by extension: .parquet or .csv")
+    parser.add_argument("--workers", type=int, default=c.INGESTION_MAX_WORKERS, help="Number of worker processes that parse statements.")
+    parser.add_argument("--no-cache", action="store_true", help="Parse every statement even if it is in the statement cache.")
+    parser.add_argument("--engine", choices=[*xu.ENGINE_DICT], default=c.DEFAULT_EXTRACTION_ENGINE, help="PDF text extraction engine. pypdfium2 and pymupdf must be installed separately.")
+    parser.add_argument("--stop-after-sections", action="store_true", help="Stop reading each statement once its transaction sections end.")
+    parser.add_argument("--profile", action="store_true", help="Log per stage timings as json lines and print a summary when done.")
+    return parser.parse_args(argv)
+
+def to_output_df(statements_df:pd.DataFrame)->pd.DataFrame:
+    # explicit string columns keep one schema across chunks, even when a chunk has no reference numbers at all
+    return statements_df.astype({column: "string" for column in OUTPUT_STRING_COLUMNS})
+
+def write_output_chunk(output_df:pd.DataFrame, output_path:str, writer_dict:Dict[str, object]):
+    """Append one chunk to the output file. writer_dict holds the open parquet writer between calls."""
+    if output_path.endswith(".csv"):
+        output_df.to_csv(output_path, mode="a" if writer_dict else "w", header=not writer_dict, index=False)
+        writer_dict["csv"] = True
+        return
+    table = pa.Table.from_pandas(output_df, preserve_index=False)
+    if not ("parquet" in writer_dict):
+        writer_dict["parquet"] = pq.ParquetWriter(output_path, table.schema)
+    writer_dict["parquet"].write_table(table.cast(writer_dict["parquet"].schema))
+
+def run_batch(
+        statement_dir:str,
+        output_path:str,
+        rules_path:Optional[str]=None,
+        max_workers:int=c.INGESTION_MAX_WORKERS,
+        use_cache:bool=True,
+        engine:str=c.DEFAULT_EXTRACTION_ENGINE,
+        stop_after_sections:bool=False
+        )->int:
+    """Stream statements file by file through parsing, categorization and output. Returns the number of files that failed."""
+    if not output_path.endswith((".csv", ".parquet")):
+        raise ValueError("output_path must end with .csv or .parquet")
+    compiled_rules = None
+    if rules_path:
+        with open(rules_path, "rb") as rules_file:
+            yaml_file_dict, vec_config_dict_key = ru.load_rules_yaml(rules_file.read())
+        compiled_rules = ru.compile_rules(yaml_file_dict[vec_config_dict_key])
+
+    pdf_path_list = sorted(glob.glob(os.path.join(statement_dir, "**", "*.pdf"), recursive=True))
+    if not (engine in xu.get_available_engines()):
+        raise ValueError(f"The {engine} extraction engine is not installed.")
+    parse_function = partial(eu.parse_statement_file, use_cache=use_cache, engine=engine, stop_after_sections=stop_after_sections)
+    writer_dict = {}
+    num_failed = 0
+    num_transactions = 0
+    try:
+        parse_results = eu.iter_parse_results(parse_function, pdf_path_list, max_workers)
+        for pdf_path, (statement_df, error_str) in zip(pdf_path_list, parse_results):
+            if error_str:
+                num_failed += 1
+                print(f"Could not parse {pdf_path}. {error_str}", file=sys.stderr)
+                continue
+            statements_df = eu.build_statements_df([statement_df])
+            if compiled_rules is not None:
+                with pu.stage_timer("assign_vec") as stage:
+                    statements_df = ru.apply_rules(statements_df, compiled_rules)
+                    stage.count("rows", len(statements_df))
+            write_output_chunk(to_output_df(statements_df), output_path, writer_dict)
+            num_transactions += len(statements_df)
+    finally:
+        if "parquet" in writer_dict:
+            writer_dict["parquet"].close()
+    print(f"Wrote {num_transactions} transactions from {len(pdf_path_list) - num_failed} of {len(pdf_path_list)} e-statements to {output_path}")
+    return num_failed
+
+def print_stats():
+    print(f"{'stage':<22}{'calls':>8}{'seconds':>11}{'max seconds':>13}  counters", file=sys.stderr)
+    for stats in pu.get_stats():
+        counters_str = " ".join(f"{name}={value}" for name, value in stats.items() if not (name in ["stage", "calls", "seconds", "max_seconds"]))
+        print(f"{stats['stage']:<22}{stats['calls']:>8}{stats['seconds']:>11.4f}{stats['max_seconds']:>13.4f}  {counters_str}", file=sys.stderr)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.profile:
+        pu.set_enabled(True)
+    num_failed = run_batch(args.statement_dir, args.output, args.rules, args.workers, not args.no_cache, args.engine, args.stop_after_sections)
+    if args.profile:
+        print_stats()
+    return 1 if num_failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,3 +1,6 @@
+import os
+import re
+
 # regex explanations
 # () grouping a pattern
 # | signifies a logical OR condition between the strings
@@ -20,4 +23,46 @@ DEBITS_STR_END_PATTERN = r"TOTAL PURCHASES AND ADJUSTMENTS FOR THIS PERIOD\s+-?\
 INTEREST_STR_START_PATTERN = r"(Page \d+ of \d+)?Interest Charged(?!\s+-?\$\d+)"
 INTEREST_STR_END_PATTERN = r"TOTAL INTEREST CHARGED FOR THIS PERIOD\s+-?\$\d+"
 
+# transaction type -> (section start pattern, section end pattern)
+SECTION_PATTERN_DICT = {
+    "Credit": (CREDITS_STR_START_PATTERN, CREDITS_STR_END_PATTERN),
+    "Debit": (DEBITS_STR_START_PATTERN, DEBITS_STR_END_PATTERN),
+    "Interest": (INTEREST_STR_START_PATTERN, INTEREST_STR_END_PATTERN),
+}
+# every line marker combined into one alternation, matched once per line. group names are <transaction type>_start, <transaction type>_end, and statement_date
+SECTION_SCANNER_REGEX = re.compile("|".join(
+    [rf"(?P<{transaction_type}_start>{start_pattern})|(?P<{transaction_type}_end>{end_pattern})" for transaction_type, (start_pattern, end_pattern) in SECTION_PATTERN_DICT.items()]
+    + [rf"(?P<statement_date>{MONTH_GROUP_STR})"]
+))
+
 column_tuple = ("Transaction_Date", "Posting_Date", "Description", "Reference_Number", "Account_Number", "Amount")
+# columns that identify one transaction when new statements are appended to those already processed
+TRANSACTION_KEY_COLUMNS = ("Transaction_Date", "Description", "Amount", "Reference_Number", "Statement_Period")
+# columns of the transaction dataframe stored as pandas categoricals, see etl_utils.enforce_statements_schema
+STATEMENTS_CATEGORY_COLUMNS = ("Transaction_Type", "Description", "Statement_Period", "Vendor_Name", "Expense_Category")
+
+# statement cache configuration
+# bump PARSER_VERSION whenever parsing logic in etl_utils changes the shape or values of a statement dataframe
+PARSER_VERSION = 5
+APP_DATA_DIR = os.path.join(os.path.expanduser("~"), ".bofa_spending_app")
+STATEMENT_CACHE_DIR = os.path.join(APP_DATA_DIR, "statement_cache")
+STATEMENT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+TRANSACTION_STORE_PATH = os.path.join(APP_DATA_DIR, "transactions.sqlite3")
+
+# statement ingestion configuration
+INGESTION_MAX_WORKERS = os.cpu_count() or 1
+# PyPDF2 is always installed; see extraction_utils.py for the optional engines
+DEFAULT_EXTRACTION_ENGINE = "pypdf2"
+# how often the sidebar polls a background ingestion job for progress and parsed statements
+INGESTION_POLL_SECONDS = 1.0
+
+# report configuration
+REPORT_TRANSACTION_TYPE = "Debit"
+AGGREGATE_CACHE_MAX_ENTRIES = 256
+# filtered transaction tables hold rows rather than totals, so fewer are kept
+FILTER_CACHE_MAX_ENTRIES = 32
+
+# instrumentation configuration
+PROFILING_ENV_VAR = "BOFA_APP_PROFILE"
+PROFILING_LOGGER_NAME = "bofa_spending_app.profiling"
+PROFILING_REPORT_LINES = 40
@@ -1,28 +1,42 @@
 # standard library
+import multiprocessing
 import os
-import re
-from typing import List, Union
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import partial
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 # suplementary packages
+import numpy as np
 import pandas as pd
-import PyPDF2
-from datetime import datetime
-from streamlit import markdown
 # custom module(s)
+import cache_utils as cu
 import constants as c
+import extraction_utils as xu
+import profiling_utils as pu
+import rule_utils as ru
+
+STATEMENT_DATE_EVENT = "statement_date"
 
 def validate_input(pdf_path:str):
     if type(pdf_path)!=str:
         raise ValueError("pdf_path must be of type str. Example '/Directory/file.pdf'")
 
-def extract_pdf_text(pdf_path:str):
+def extract_pdf_text(pdf_path:str, engine:str=c.DEFAULT_EXTRACTION_ENGINE):
     validate_input(pdf_path) # raises TypeError for invalid args
-    pdf_reader = PyPDF2.PdfReader(pdf_path) # Raises a FileNotFoundError if invalid file path
-    pdf_length = len(pdf_reader.pages)
-    pdf_text = ""
-    for i in range(0, pdf_length):
-        page_text = pdf_reader.pages[i].extract_text()
-        pdf_text = pdf_text + page_text
-    return pdf_text
+    return "".join(xu.iter_page_text(pdf_path, engine)) # Raises a FileNotFoundError if invalid file path
+
+def extract_pdf_bytes_text(file_bytes:bytes, engine:str=c.DEFAULT_EXTRACTION_ENGINE):
+    return "".join(xu.iter_page_text(file_bytes, engine))
+
+def iter_text_lines(text_iterable:Iterable[str])->Iterator[str]:
+    """Yield the lines of consecutive text chunks as if the chunks were one string.
+    Pages are joined without a separator, so the unfinished last line of a page is carried into the next one."""
+    partial_line = ""
+    for text in text_iterable:
+        line_list = (partial_line + text).split("\n")
+        partial_line = line_list.pop()
+        yield from line_list
+    yield partial_line
 
 def validate_transaction_str(transaction_str:str):
     invalid_str_list = ["Page", "page", "Continue", "continue", "Number", "Amount", "Total", "Purchases", "Adjustments"]
@@ -62,68 +76,89 @@ def unpack_transaction(transaction_str:str, transaction_type:str):
         print(error_str)
     return transaction_data
 
-def find_match_index(transactions_list:List[str], pattern:str):
-    for i in range(0, len(transactions_list)):
-        transaction_value = transactions_list[i]
-        try:
-            match_value = re.match(pattern=pattern, string=transaction_value)[0]
-            break
-        except TypeError as te:
+def iter_statement_events(line_iterable:Iterable[str], stop_after_sections:bool=False)->Iterator[Tuple[str, Union[str, List[Optional[str]]]]]:
+    """Run the section state machine over a stream of lines.
+    Yields (STATEMENT_DATE_EVENT, line) for the statement date range line, and (transaction_type, transaction_data) for each transaction row.
+    A section header seen while that section is already open (a page break continuation) is read as a row of that section.
+    A section that is never closed runs to the end of the text.
+    With stop_after_sections, reading stops once the statement date was seen and every section has closed, so later pages are never extracted."""
+    open_section_set = set()
+    closed_section_set = set()
+    has_statement_date = False
+    for line in line_iterable:
+        match = c.SECTION_SCANNER_REGEX.match(line)
+        transaction_type, marker = None, None
+        if match is not None:
+            if match.lastgroup==STATEMENT_DATE_EVENT:
+                has_statement_date = True
+                yield STATEMENT_DATE_EVENT, line
+            else:
+                transaction_type, marker = match.lastgroup.rsplit("_", 1)
+        if (marker=="end") and (transaction_type in open_section_set):
+            open_section_set.remove(transaction_type)
+            closed_section_set.add(transaction_type)
+        for open_transaction_type in open_section_set:
+            transaction_data = unpack_transaction(line, open_transaction_type)
+            if any(value is not None for value in transaction_data):
+                yield open_transaction_type, transaction_data
+        if marker=="start":
+            open_section_set.add(transaction_type)
+        if stop_after_sections and has_statement_date and (not open_section_set) and (len(closed_section_set)==len(c.SECTION_PATTERN_DICT)):
+            return
+
+def collect_statement_rows(event_iterable:Iterable[Tuple[str, Union[str, List[Optional[str]]]]])->Tuple[Optional[str], Dict[str, List[List[Optional[str]]]]]:
+    """Consume statement events into the first statement date line and the transaction rows of each section."""
+    statement_date_str = None
+    section_rows = {transaction_type: [] for transaction_type in c.SECTION_PATTERN_DICT}
+    for event_type, event_data in event_iterable:
+        if event_type==STATEMENT_DATE_EVENT:
+            if statement_date_str is None:
+                statement_date_str = event_data
             continue
-    return i
+        section_rows[event_type].append(event_data)
+    return statement_date_str, section_rows
 
-def get_statement_year(pdf_text_list:List[str]):
-    i = find_match_index(pdf_text_list, c.MONTH_GROUP_STR)
-    statement_date_range_str = pdf_text_list[i]
-    if ("December" in statement_date_range_str) and ("January" in statement_date_range_str):
-        needs_mapping, statement_year = True, statement_date_range_str.split()[-1]
+def get_statement_year(statement_date_str:Optional[str]):
+    if statement_date_str is None:
+        raise ValueError("No statement date range was found in the e-statement text.")
+    if ("December" in statement_date_str) and ("January" in statement_date_str):
+        needs_mapping, statement_year = True, statement_date_str.split()[-1]
     else:
-        needs_mapping, statement_year = False, statement_date_range_str.split()[-1]
+        needs_mapping, statement_year = False, statement_date_str.split()[-1]
     return needs_mapping, statement_year
 
-def get_transaction_data(transactions_list:List[str], start_str:str, end_str:str, transaction_type:str):
-    start = find_match_index(transactions_list, start_str) + 1
-    end = find_match_index(transactions_list, end_str)
-    transactions_list = transactions_list[start:end]
-    for i in range(0, len(transactions_list)):
-        transactions_list[i] = unpack_transaction(transactions_list[i], transaction_type)
+def get_transaction_data(transactions_list:List[List[Optional[str]]], transaction_type:str):
     df = pd.DataFrame(data=transactions_list, columns=c.column_tuple)
-    df = df.dropna(how="all", axis=0)
     df["Transaction_Type"] = transaction_type
     return df
 
+@pu.timed("clean_statement")
 def clean_statement(df:pd.DataFrame):
-    df["Amount"] = df["Amount"].str.replace(",", "").str.strip()
-    for i in range(0, len(df)):
-        try:
-            # clean transaction date column
-            try:
-                transaction_date = df["Transaction_Date"][i]
-                year, month, day = map(int, transaction_date.split("/"))
-                td_object = datetime(year=year, month=month, day=day)
-            except Exception as e:
-                td_object = None
-            # clean amount of transaction for transactions with multiline descriptions
-            try:
-                amount = df["Amount"][i]
-                amount = float(amount)
-            except Exception as e:
-                amount = df["Amount"][i+1]
-                amount = float(amount)
-        except Exception as e:
-            st.markdown(f"FUNCTION: clean_statement ERROR TYPE{type(e)} ERRRO STR: {e}")
-        df["Transaction_Date"][i] = td_object.date() if td_object else None
-        df["Amount"][i] = amount
+    df["Transaction_Date"] = pd.to_datetime(df["Transaction_Date"], format="%Y/%m/%d", errors="coerce")
+    amounts = pd.to_numeric(df["Amount"].str.replace(",", "").str.strip(), errors="coerce")
+    # transactions with multiline descriptions carry their amount on the following line
+    df["Amount"] = amounts.fillna(amounts.shift(-1))
     df = df.dropna(subset=["Transaction_Date", "Description"], how="any", ignore_index=True)
     return df
 
 def get_statement_df(pdf_text:str)->pd.DataFrame:
-    pdf_text_list = pdf_text.split("\n")
-    needs_mapping, statement_year = get_statement_year(pdf_text_list)
-    credit_df = get_transaction_data(pdf_text_list, c.CREDITS_STR_START_PATTERN, c.CREDITS_STR_END_PATTERN, "Credit")
-    debit_df = get_transaction_data(pdf_text_list, c.DEBITS_STR_START_PATTERN, c.DEBITS_STR_END_PATTERN, "Debit")
-    interest_df = get_transaction_data(pdf_text_list, c.INTEREST_STR_START_PATTERN, c.INTEREST_STR_END_PATTERN, "Interest")
-    statement_df = pd.concat(objs=[credit_df, debit_df, interest_df], ignore_index=True)
+    return get_statement_df_from_lines(iter_text_lines([pdf_text]))
+
+@pu.timed("get_statement_df")
+def get_statement_df_from_lines(line_iterable:Iterable[str], stop_after_sections:bool=False)->pd.DataFrame:
+    """Parse a statement from a stream of lines. Only the transaction rows are held in memory, never the whole text."""
+    with pu.stage_timer("collect_statement_rows") as stage:
+        # lines are pulled from lazy PDF extraction, which is timed as extract_pdf_text
+        line_iterable = pu.exclude_waits(line_iterable, stage)
+        statement_date_str, section_rows = collect_statement_rows(iter_statement_events(line_iterable, stop_after_sections))
+    needs_mapping, statement_year = get_statement_year(statement_date_str)
+    section_df_list = [get_transaction_data(transactions_list, transaction_type) for transaction_type, transactions_list in section_rows.items()]
+    statement_df = pd.concat(objs=section_df_list, ignore_index=True)
+    if statement_df.empty:
+        # a statement without transactions has untyped columns, which pandas 3 cannot join into a date string
+        statement_df = statement_df.astype({"Transaction_Date": "datetime64[ns]", "Amount": "float64"})
+        statement_df["Statement_Period"] = statement_date_str.strip()
+        return statement_df
     statement_df["Year"] = statement_year
     if needs_mapping:
         # map December entries to the previous year
@@ -131,5 +166,125 @@ def get_statement_df(pdf_text:str)->pd.DataFrame:
         statement_df.loc[bool_array, "Year"] = str(int(statement_year) - 1)
     statement_df["Transaction_Date"] = statement_df["Year"] + "/" + statement_df["Transaction_Date"]
     statement_df = statement_df.drop(labels=["Year"], axis=1)
+    statement_df["Statement_Period"] = statement_date_str.strip()
     statement_df = clean_statement(statement_df)
-    return statement_df
\ No newline at end of file
+    pu.count("get_statement_df", "rows", len(statement_df))
+    return statement_df
+
+def get_transaction_keys(statements_df:pd.DataFrame)->np.ndarray:
+    """Hash the columns that identify a transaction across uploads into one uint64 key per row."""
+    key_df = statements_df[list(c.TRANSACTION_KEY_COLUMNS)].astype(str)
+    return pd.util.hash_pandas_object(key_df, index=False).to_numpy()
+
+def get_transaction_key_set(statements_df:pd.DataFrame)->set:
+    return set(get_transaction_keys(statements_df).tolist())
+
+def drop_existing_transactions(existing_key_set:set, new_statements_df:pd.DataFrame)->Tuple[pd.DataFrame, np.ndarray]:
+    """Remove rows of new_statements_df whose transaction key is in existing_key_set or on an earlier row of new_statements_df. Returns the kept rows and their keys."""
+    new_key_array = get_transaction_keys(new_statements_df)
+    # the same statement uploaded twice in one batch repeats every key
+    is_repeated = pd.Series(new_key_array).duplicated().to_numpy()
+    is_existing = is_repeated | np.fromiter((key in existing_key_set for key in new_key_array.tolist()), dtype=bool, count=len(new_key_array))
+    return new_statements_df[~is_existing].reset_index(drop=True), new_key_array[~is_existing]
+
+def concat_statements(statements_df_list:List[pd.DataFrame])->pd.DataFrame:
+    """Concatenate processed statements. Categorical columns whose categories differ between frames are rebuilt over their union."""
+    combined_df = pd.concat(objs=statements_df_list, ignore_index=True)
+    return enforce_statements_schema(combined_df)
+
+def to_sorted_category(series:pd.Series)->pd.Series:
+    """Cast to a categorical whose categories are sorted, so sorting by the column sorts by value rather than by first appearance."""
+    if not isinstance(series.dtype, pd.CategoricalDtype):
+        return series.astype("category")
+    if series.cat.categories.is_monotonic_increasing:
+        return series
+    return series.cat.reorder_categories(series.cat.categories.sort_values())
+
+def enforce_statements_schema(statements_df:pd.DataFrame)->pd.DataFrame:
+    """Cast the transaction frame to its canonical dtypes: datetime64 dates, float64 amounts, categoricals for repeated strings and an int32 rule id."""
+    if not pd.api.types.is_datetime64_any_dtype(statements_df["Transaction_Date"]):
+        statements_df["Transaction_Date"] = pd.to_datetime(statements_df["Transaction_Date"], errors="coerce")
+    statements_df["Amount"] = statements_df["Amount"].astype("float64")
+    for column in c.STATEMENTS_CATEGORY_COLUMNS:
+        statements_df[column] = to_sorted_category(statements_df[column])
+    statements_df["Rule_Id"] = statements_df["Rule_Id"].astype("int32")
+    statements_df["Rule_Applied_bool"] = statements_df["Rule_Applied_bool"].astype(bool)
+    return statements_df
+
+def parse_statement_bytes(file_bytes:bytes, engine:str=c.DEFAULT_EXTRACTION_ENGINE, stop_after_sections:bool=False)->Tuple[Optional[pd.DataFrame], Optional[str]]:
+    """Extract and parse one statement, returning (statement_df, None) on success or (None, error_str) on failure."""
+    try:
+        line_iterator = iter_text_lines(xu.iter_page_text(file_bytes, engine))
+        return get_statement_df_from_lines(line_iterator, stop_after_sections), None
+    except Exception as e:
+        return None, f"ERROR TYPE: {type(e)} ERROR STR: {e}"
+
+def parse_statement_file(pdf_path:str, use_cache:bool=True, engine:str=c.DEFAULT_EXTRACTION_ENGINE, stop_after_sections:bool=False)->Tuple[Optional[pd.DataFrame], Optional[str]]:
+    """Read, look up in the statement cache, and parse one statement file. Runs inside pool workers, so only the path crosses processes."""
+    try:
+        with open(pdf_path, "rb") as pdf_file:
+            file_bytes = pdf_file.read()
+    except OSError as e:
+        return None, f"ERROR TYPE: {type(e)} ERROR STR: {e}"
+    if not use_cache:
+        return parse_statement_bytes(file_bytes, engine, stop_after_sections)
+    file_digest = cu.get_file_digest(file_bytes, xu.get_extraction_key(engine, stop_after_sections))
+    statement_df = cu.load_cached_statement(file_digest)
+    if statement_df is not None:
+        return statement_df, None
+    statement_df, error_str = parse_statement_bytes(file_bytes, engine, stop_after_sections)
+    if statement_df is not None:
+        cu.store_cached_statement(file_digest, statement_df)
+    return statement_df, error_str
+
+def iter_parse_results(parse_function:Callable, item_iterable:Iterable, max_workers:int=c.INGESTION_MAX_WORKERS)->Iterator[Tuple[Optional[pd.DataFrame], Optional[str]]]:
+    """Yield parse_function(item) for every item, in order, from a process pool.
+    At most two items per worker are in flight, so memory stays bounded however many items there are."""
+    if max_workers<=1:
+        for item in item_iterable:
+            yield parse_function(item)
+        return
+    # workers do not share this process's instrumentation flag or totals, so their stage stats are sent back with each result
+    collects_stats = pu.is_enabled()
+    if collects_stats:
+        parse_function = partial(pu.call_with_stats, parse_function)
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=get_pool_context()) as executor:
+        pending_futures = deque()
+        try:
+            for item in item_iterable:
+                pending_futures.append(executor.submit(parse_function, item))
+                if len(pending_futures)>=2*max_workers:
+                    yield get_parse_result(pending_futures.popleft(), collects_stats)
+            while pending_futures:
+                yield get_parse_result(pending_futures.popleft(), collects_stats)
+        finally:
+            # a consumer that stops early, like a cancelled ingestion job, only waits for items already being parsed
+            executor.shutdown(cancel_futures=True)
+
+def get_pool_context():
+    """Start pool workers with forkserver where available, else spawn. Forking a multi-threaded process, like the Streamlit server or its ingestion thread, can deadlock the child."""
+    start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return multiprocessing.get_context(start_method)
+
+def get_parse_result(future:Future, collects_stats:bool=False)->Tuple[Optional[pd.DataFrame], Optional[str]]:
+    try:
+        result = future.result()
+    except Exception as e:
+        # a crashed worker breaks the pool, so this and every later file is reported as failed
+        return None, f"ERROR TYPE: {type(e)} ERROR STR: {e}"
+    if collects_stats:
+        result, worker_stats = result
+        pu.merge_stats(worker_stats)
+    return result
+
+@pu.timed("build_statements_df")
+def build_statements_df(statements_list:List[pd.DataFrame])->pd.DataFrame:
+    """Combine parsed statements into the transaction frame used by the app and the batch pipeline, before rules are applied."""
+    all_statements_df = pd.concat(objs=statements_list, ignore_index=True)
+    all_statements_df = all_statements_df[["Transaction_Date", "Transaction_Type", "Description", "Amount", "Reference_Number", "Statement_Period"]].reset_index(drop=True)
+    all_statements_df["Vendor_Name"] = ""
+    all_statements_df["Expense_Category"] = ""
+    all_statements_df["Rule_Id"] = ru.NO_RULE_INDEX
+    all_statements_df["Rule_Applied_bool"] = False
+    # descriptions repeat heavily across statements, so they are dictionary encoded and rules run once per distinct value
+    return enforce_statements_schema(all_statements_df)
@@ -0,0 +1,85 @@
+# standard library
+import importlib.util
+import io
+from typing import Iterator, List, Union
+# suplementary packages
+import PyPDF2
+# custom module(s)
+import constants as c
+import profiling_utils as pu
+
+# characters other engines emit where PyPDF2 emits plain ascii, which the section regexes and amount parsing expect.
+# PyPDF2 text is never rewritten, since descriptions feed exact match rules
+TEXT_REPLACEMENT_LIST = [
+    ("\r\n", "\n"),
+    ("\r", "\n"),
+    ("\xa0", " "), # no-break space
+    ("\u2009", " "), # thin space
+    ("\u2212", "-"), # minus sign
+    ("\u2013", "-"), # en dash
+    ("\ufb01", "fi"),
+    ("\ufb02", "fl"),
+]
+
+def normalize_page_text(page_text:str)->str:
+    """Map another engine's page text toward what PyPDF2 emits for the same page."""
+    for old_str, new_str in TEXT_REPLACEMENT_LIST:
+        if old_str in page_text:
+            page_text = page_text.replace(old_str, new_str)
+    # PyPDF2 ends pages with a line break, so the last line is not joined to the next page's first line
+    if page_text and not page_text.endswith("\n"):
+        page_text = page_text + "\n"
+    return page_text
+
+def iter_pypdf2_pages(pdf_source:Union[str, bytes])->Iterator[str]:
+    pdf_reader = PyPDF2.PdfReader(io.BytesIO(pdf_source) if isinstance(pdf_source, bytes) else pdf_source)
+    for page in pdf_reader.pages:
+        yield page.extract_text()
+
+def iter_pypdfium2_pages(pdf_source:Union[str, bytes])->Iterator[str]:
+    import pypdfium2 # optional dependency, checked by get_available_engines
+    pdf_document = pypdfium2.PdfDocument(pdf_source)
+    try:
+        for i in range(len(pdf_document)):
+            page = pdf_document[i]
+            text_page = page.get_textpage()
+            page_text = text_page.get_text_range()
+            text_page.close()
+            page.close()
+            yield page_text
+    finally:
+        pdf_document.close()
+
+def iter_pymupdf_pages(pdf_source:Union[str, bytes])->Iterator[str]:
+    import pymupdf # optional dependency, checked by get_available_engines
+    if isinstance(pdf_source, bytes):
+        pdf_document = pymupdf.open(stream=pdf_source, filetype="pdf")
+    else:
+        pdf_document = pymupdf.open(pdf_source)
+    with pdf_document:
+        for page in pdf_document:
+            yield page.get_text()
+
+# engine name: (module that must be importable, page text generator, whether page text is normalized toward PyPDF2's)
+ENGINE_DICT = {
+    "pypdf2": ("PyPDF2", iter_pypdf2_pages, False),
+    "pypdfium2": ("pypdfium2", iter_pypdfium2_pages, True),
+    "pymupdf": ("pymupdf", iter_pymupdf_pages, True),
+}
+
+def get_available_engines()->List[str]:
+    return [engine for engine, (module_name, _, _) in ENGINE_DICT.items() if importlib.util.find_spec(module_name) is not None]
+
+def get_extraction_key(engine:str, stop_after_sections:bool)->str:
+    """Identify extraction options that can change parsed output, for the statement cache. The defaults map to an empty key."""
+    if (engine==c.DEFAULT_EXTRACTION_ENGINE) and not stop_after_sections:
+        return ""
+    return f"{engine}:{int(stop_after_sections)}"
+
+def iter_page_text(pdf_source:Union[str, bytes], engine:str=c.DEFAULT_EXTRACTION_ENGINE)->Iterator[str]:
+    """Yield the text of each page of a PDF path or PDF bytes as it is extracted, so parsing can start before the last page is read."""
+    if not (engine in ENGINE_DICT):
+        raise ValueError(f"engine must be one of {[*ENGINE_DICT]}")
+    _, iter_engine_pages, normalize = ENGINE_DICT[engine]
+    for page_text in pu.iter_timed(iter_engine_pages(pdf_source), "extract_pdf_text", "pages"):
+        yield normalize_page_text(page_text) if normalize else page_text
@@ -0,0 +1,118 @@
+# standard library
+import threading
+from functools import partial
+from typing import Dict, List, Optional, Tuple
+# suplementary packages
+import pandas as pd
+# custom module(s)
+import cache_utils as cu
+import constants as c
+import etl_utils as eu
+import extraction_utils as xu
+import profiling_utils as pu
+
+# a job is a plain dict shared between the script thread and its worker thread. Fields the worker thread writes are guarded by "lock".
+# the worker thread never touches streamlit, since it runs without a script run context
+
+def start_job(
+        file_bytes_list:List[bytes],
+        file_name_list:List[str],
+        max_workers:int=c.INGESTION_MAX_WORKERS,
+        engine:str=c.DEFAULT_EXTRACTION_ENGINE,
+        stop_after_sections:bool=False,
+        capture_kind:Optional[str]=None
+        )->Dict[str, object]:
+    """Parse statements on a background thread. Poll the returned job with take_parsed_statements and get_progress."""
+    job = {
+        "lock": threading.Lock(),
+        "cancel_event": threading.Event(),
+        "file_name_list": file_name_list,
+        "num_files": len(file_bytes_list),
+        "num_done": 0,
+        # results wait here until every earlier file has a result, so statements are published in upload order
+        "ready_dict": {},
+        "next_index": 0,
+        "pending_statement_list": [],
+        "failure_list": [],
+        "status": "running",
+    }
+    job["thread"] = threading.Thread(
+        target=run_job,
+        args=(job, file_bytes_list, max_workers, engine, stop_after_sections, capture_kind),
+        name="statement-ingestion",
+        daemon=True
+        )
+    job["thread"].start()
+    return job
+
+def publish_result(job:Dict[str, object], i:int):
+    # callers hold the job lock
+    statement_df, error_str = job["ready_dict"].pop(i)
+    if error_str:
+        job["failure_list"].append((job["file_name_list"][i], error_str))
+    else:
+        job["pending_statement_list"].append(statement_df)
+
+def record_result(job:Dict[str, object], i:int, statement_df:Optional[pd.DataFrame], error_str:Optional[str]):
+    with job["lock"]:
+        job["num_done"] += 1
+        job["ready_dict"][i] = (statement_df, error_str)
+        while job["next_index"] in job["ready_dict"]:
+            publish_result(job, job["next_index"])
+            job["next_index"] += 1
+
+def run_job(job:Dict[str, object], file_bytes_list:List[bytes], max_workers:int, engine:str, stop_after_sections:bool, capture_kind:Optional[str]):
+    """Worker thread body. Cached statements are loaded first and the rest parsed in upload order. Either way they are published in upload order."""
+    cancel_event = job["cancel_event"]
+    parse_results = None
+    try:
+        # cProfile only sees the thread it is enabled on, so the capture is taken here rather than around the page
+        with pu.capture("ingest_statements", capture_kind), pu.stage_timer("ingest_statements") as stage:
+            stage.count("files", len(file_bytes_list))
+            extraction_key = xu.get_extraction_key(engine, stop_after_sections)
+            file_digest_list = [cu.get_file_digest(file_bytes, extraction_key) for file_bytes in file_bytes_list]
+            miss_indices = []
+            for i, file_digest in enumerate(file_digest_list):
+                if cancel_event.is_set():
+                    return
+                statement_df = cu.load_cached_statement(file_digest)
+                if statement_df is None:
+                    miss_indices.append(i)
+                else:
+                    record_result(job, i, statement_df, None)
+            parse_function = partial(eu.parse_statement_bytes, engine=engine, stop_after_sections=stop_after_sections)
+            parse_results = eu.iter_parse_results(parse_function, (file_bytes_list[i] for i in miss_indices), min(max_workers, len(miss_indices)))
+            for i, (statement_df, error_str) in zip(miss_indices, parse_results):
+                if not error_str:
+                    cu.store_cached_statement(file_digest_list[i], statement_df)
+                record_result(job, i, statement_df, error_str)
+                if cancel_event.is_set():
+                    return
+    except Exception as e:
+        with job["lock"]:
+            job["failure_list"].append(("ingestion job", f"ERROR TYPE: {type(e)} ERROR STR: {e}"))
+    finally:
+        if parse_results is not None:
+            # closing the generator cancels statements queued in the process pool
+            parse_results.close()
+        with job["lock"]:
+            # a cancelled job can leave results waiting on a file that was never parsed. They are still published, in upload order
+            for i in sorted(job["ready_dict"]):
+                publish_result(job, i)
+            job["status"] = "cancelled" if cancel_event.is_set() else "done"
+
+def cancel_job(job:Dict[str, object]):
+    """Ask the worker thread to stop. Statements already in the process pool finish, the rest are never parsed."""
+    job["cancel_event"].set()
+
+def take_parsed_statements(job:Dict[str, object])->List[pd.DataFrame]:
+    """Return the statements parsed since the last call."""
+    with job["lock"]:
+        statement_list = job["pending_statement_list"]
+        job["pending_statement_list"] = []
+    return statement_list
+
+def get_progress(job:Dict[str, object])->Tuple[int, int, str, List[Tuple[str, str]]]:
+    """Return (files done, files in the job, status, [(file name, error)])."""
+    with job["lock"]:
+        return job["num_done"], job["num_files"], job["status"], list(job["failure_list"])
@@ -0,0 +1,200 @@
+# standard library
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from functools import wraps
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+# custom module(s)
+import constants as c
+
+logger = logging.getLogger(c.PROFILING_LOGGER_NAME)
+
+# module level state, so the disabled check on the hot path is a single global lookup
+ENABLED = os.environ.get(c.PROFILING_ENV_VAR, "") not in ("", "0")
+STAGE_STATS = {}
+CAPTURE_REPORTS = {}
+# the ingestion thread records stages while the script thread reads them for the diagnostics panel
+STATS_LOCK = threading.Lock()
+
+class NullStage:
+    """Stand-in returned by stage_timer while instrumentation is disabled. Every method is a no-op."""
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc_info):
+        return False
+    def count(self, name:str, value:float):
+        pass
+
+NULL_STAGE = NullStage()
+
+class Stage:
+    """Time one run of a pipeline stage and record it with any counters set through count()."""
+    def __init__(self, stage_name:str):
+        self.stage_name = stage_name
+        self.counters = {}
+        self.excluded_seconds = 0.0
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    def __exit__(self, *exc_info):
+        record_stage(self.stage_name, time.perf_counter() - self.start - self.excluded_seconds, self.counters)
+        return False
+    def count(self, name:str, value:float):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+def set_enabled(enabled:bool):
+    global ENABLED
+    ENABLED = bool(enabled)
+    if ENABLED and not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+
+def is_enabled()->bool:
+    return ENABLED
+
+def stage_timer(stage_name:str):
+    """Context manager timing a stage. Costs one flag check when instrumentation is disabled."""
+    if not ENABLED:
+        return NULL_STAGE
+    return Stage(stage_name)
+
+def timed(stage_name:str):
+    """Decorator form of stage_timer for functions timed as a whole."""
+    def decorator(function:Callable):
+        @wraps(function)
+        def timed_function(*args, **kwargs):
+            if not ENABLED:
+                return function(*args, **kwargs)
+            with Stage(stage_name):
+                return function(*args, **kwargs)
+        return timed_function
+    return decorator
+
+def exclude_waits(iterable:Iterable, stage)->Iterable:
+    """Wrap an iterable consumed inside stage, so the time spent waiting on it is left out of the stage's time."""
+    if stage is NULL_STAGE:
+        return iterable
+    return iter_excluding_waits(iterable, stage)
+
+def iter_excluding_waits(iterable:Iterable, stage:Stage)->Iterator:
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            stage.excluded_seconds += time.perf_counter() - start
+        yield item
+
+def iter_timed(iterable:Iterable, stage_name:str, counter_name:str)->Iterable:
+    """Record each item pulled from iterable as one call of stage_name. The pull that finds it exhausted is not recorded."""
+    if not ENABLED:
+        return iterable
+    return iter_timed_items(iterable, stage_name, counter_name)
+
+def iter_timed_items(iterable:Iterable, stage_name:str, counter_name:str)->Iterator:
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        record_stage(stage_name, time.perf_counter() - start, {counter_name: 1})
+        yield item
+
+def count(stage_name:str, name:str, value:float=1):
+    """Add to a counter of stage_name without timing anything, e.g. cache hits."""
+    if not ENABLED:
+        return
+    with STATS_LOCK:
+        stats = STAGE_STATS.setdefault(stage_name, {"calls": 0, "seconds": 0.0, "max_seconds": 0.0})
+        stats[name] = stats.get(name, 0) + value
+    logger.info(json.dumps({"event": "count", "stage": stage_name, name: value}))
+
+def record_stage(stage_name:str, seconds:float, counters:Dict[str, float]):
+    with STATS_LOCK:
+        stats = STAGE_STATS.setdefault(stage_name, {"calls": 0, "seconds": 0.0, "max_seconds": 0.0})
+        stats["calls"] += 1
+        stats["seconds"] += seconds
+        stats["max_seconds"] = max(stats["max_seconds"], seconds)
+        for name, value in counters.items():
+            stats[name] = stats.get(name, 0) + value
+    logger.info(json.dumps({"event": "stage", "stage": stage_name, "seconds": round(seconds, 6), **counters}))
+
+def merge_stats(worker_stats:Dict[str, Dict[str, float]]):
+    """Fold stage stats collected in a worker process into this process's totals."""
+    with STATS_LOCK:
+        for stage_name, worker_stage_stats in worker_stats.items():
+            stats = STAGE_STATS.setdefault(stage_name, {"calls": 0, "seconds": 0.0, "max_seconds": 0.0})
+            for name, value in worker_stage_stats.items():
+                stats[name] = max(stats[name], value) if name=="max_seconds" else stats.get(name, 0) + value
+
+def call_with_stats(function:Callable, *args):
+    """Run function in a worker process with instrumentation enabled and return (result, stage stats of that call)."""
+    set_enabled(True)
+    STAGE_STATS.clear()
+    result = function(*args)
+    return result, dict(STAGE_STATS)
+
+def get_stats()->List[Dict[str, float]]:
+    """Return one record per stage, slowest total first."""
+    with STATS_LOCK:
+        stats_list = [{"stage": stage_name, **stats} for stage_name, stats in STAGE_STATS.items()]
+    return sorted(stats_list, key=lambda stats: stats["seconds"], reverse=True)
+
+def get_capture_reports()->Dict[str, str]:
+    with STATS_LOCK:
+        return dict(CAPTURE_REPORTS)
+
+def reset_stats():
+    with STATS_LOCK:
+        STAGE_STATS.clear()
+        CAPTURE_REPORTS.clear()
+
+@contextmanager
+def capture(label:str, capture_kind:Optional[str]):
+    """Profile the enclosed block with "cProfile" or "tracemalloc" and keep a text report under label. None captures nothing.
+    Only this process is profiled, so parsing in worker processes shows up as time spent waiting on the pool."""
+    if not ENABLED or (capture_kind is None):
+        yield
+        return
+    if capture_kind=="cProfile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            report_stream = io.StringIO()
+            pstats.Stats(profiler, stream=report_stream).sort_stats("cumulative").print_stats(c.PROFILING_REPORT_LINES)
+            with STATS_LOCK:
+                CAPTURE_REPORTS[label] = report_stream.getvalue()
+    elif capture_kind=="tracemalloc":
+        was_tracing = tracemalloc.is_tracing()
+        if not was_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        snapshot_before = tracemalloc.take_snapshot()
+        try:
+            yield
+        finally:
+            peak_bytes = tracemalloc.get_traced_memory()[1]
+            top_stats = tracemalloc.take_snapshot().compare_to(snapshot_before, "lineno")[:c.PROFILING_REPORT_LINES]
+            if not was_tracing:
+                tracemalloc.stop()
+            with STATS_LOCK:
+                CAPTURE_REPORTS[label] = f"Peak traced memory: {peak_bytes/(1024*1024):.1f} MiB\n" + "\n".join(str(stat) for stat in top_stats)
+    else:
+        raise ValueError("capture_kind must be None, 'cProfile' or 'tracemalloc'")
@@ -0,0 +1,95 @@
+# standard library
+from datetime import date
+from typing import Dict, List
+# suplementary packages
+import numpy as np
+import pandas as pd
+# custom module(s)
+import constants as c
+
+# columns of the filterable transaction table, see filter_period
+REPORT_TABLE_COLUMNS = ["Transaction_Date", "Description", "Amount", "Vendor_Name", "Expense_Category"]
+
+def format_period_label(period:pd.Period)->str:
+    # months and quarters are both zero padded to two digits, e.g. 2024/03 for March and 2024/01 for Q1
+    sub_period = period.month if period.freqstr.startswith("M") else period.quarter
+    return f"{period.year}/{sub_period:02d}"
+
+def build_period_index(statements_df:pd.DataFrame, freq:str)->Dict[str, np.ndarray]:
+    """Map each period label ("M" for months, "Q" for quarters) to the row positions of its debit transactions, in label order."""
+    debit_positions = np.flatnonzero((statements_df["Transaction_Type"]==c.REPORT_TRANSACTION_TYPE).to_numpy())
+    periods = statements_df["Transaction_Date"].iloc[debit_positions].dt.to_period(freq)
+    group_positions = pd.Series(debit_positions).groupby(periods.to_numpy()).indices
+    period_index = {format_period_label(period): debit_positions[positions] for period, positions in group_positions.items()}
+    return dict(sorted(period_index.items()))
+
+def merge_period_index(period_index:Dict[str, np.ndarray], new_period_index:Dict[str, np.ndarray], offset:int)->Dict[str, np.ndarray]:
+    """Add the period index of rows appended at position offset to an existing period index."""
+    merged_index = dict(period_index)
+    for period_label, positions in new_period_index.items():
+        shifted_positions = positions + offset
+        if period_label in merged_index:
+            merged_index[period_label] = np.concatenate([merged_index[period_label], shifted_positions])
+        else:
+            merged_index[period_label] = shifted_positions
+    return dict(sorted(merged_index.items()))
+
+def build_period_aggregates(period_df:pd.DataFrame, max_n:int=10)->Dict[str, object]:
+    """Totals and top max_n transactions, vendors and expense categories by amount for one report period."""
+    top_transactions_df = period_df[["Description", "Amount"]].sort_values(by=["Amount"], ascending=False, kind="stable").head(max_n).reset_index(drop=True)
+    vendor_df = period_df[["Vendor_Name", "Expense_Category", "Amount"]].groupby(by=["Vendor_Name", "Expense_Category"], observed=True).sum()
+    expense_category_df = period_df[["Expense_Category", "Amount"]].groupby(by=["Expense_Category"], observed=True).sum()
+    return {
+        "total_spent": float(period_df["Amount"].sum()),
+        "top_transactions_df": top_transactions_df,
+        "top_vendors_df": vendor_df.sort_values(by=["Amount"], ascending=False, kind="stable").head(max_n).reset_index(),
+        "top_expense_categories_df": expense_category_df.sort_values(by=["Amount"], ascending=False, kind="stable").head(max_n).reset_index(),
+    }
+
+def build_filter_arrays(period_df:pd.DataFrame)->Dict[str, np.ndarray]:
+    """Numpy columns of one report period for filter_period, presorted in table order: date, description, vendor name and expense category ascending, then amount descending.
+    Categorical codes sort like their values because the categories of statements_df are kept sorted."""
+    days = period_df["Transaction_Date"].to_numpy().astype("datetime64[D]").astype(np.int64)
+    amounts = period_df["Amount"].to_numpy(dtype=np.float64)
+    description_codes = period_df["Description"].cat.codes.to_numpy()
+    vendor_codes = period_df["Vendor_Name"].cat.codes.to_numpy()
+    expense_category_codes = period_df["Expense_Category"].cat.codes.to_numpy()
+    # np.lexsort sorts by the last key first and is stable, so ties keep row order like sort_values
+    order = np.lexsort((-amounts, expense_category_codes, vendor_codes, description_codes, days))
+    return {
+        "order": order,
+        "days": days[order],
+        "amounts": amounts[order],
+        "vendor_codes": vendor_codes[order],
+        "expense_category_codes": expense_category_codes[order],
+    }
+
+def get_code_mask(categories:pd.Index, value_list:List[str])->np.ndarray:
+    """Boolean lookup table over category codes marking the codes of value_list. Its extra last slot keeps code -1 (missing) unselected."""
+    code_mask = np.zeros(len(categories) + 1, dtype=bool)
+    codes = categories.get_indexer(value_list)
+    code_mask[codes[codes>=0]] = True
+    return code_mask
+
+def filter_period(
+        period_df:pd.DataFrame,
+        filter_arrays:Dict[str, np.ndarray],
+        min_date:date,
+        max_date:date,
+        min_amount:float,
+        max_amount:float,
+        vendor_list:List[str],
+        expense_category_list:List[str]
+        )->pd.DataFrame:
+    """Filter one report period with a single combined mask over its presorted arrays. Rows come out in table order without sorting.
+    As in the report widgets, the amount range is ignored when either bound is zero and an empty selection list keeps every value."""
+    days = filter_arrays["days"]
+    mask = (days>=np.datetime64(min_date, "D").astype(np.int64)) & (days<=np.datetime64(max_date, "D").astype(np.int64))
+    if min_amount and max_amount:
+        amounts = filter_arrays["amounts"]
+        mask &= (amounts>=min_amount) & (amounts<=max_amount)
+    if vendor_list:
+        mask &= get_code_mask(period_df["Vendor_Name"].cat.categories, vendor_list)[filter_arrays["vendor_codes"]]
+    if expense_category_list:
+        mask &= get_code_mask(period_df["Expense_Category"].cat.categories, expense_category_list)[filter_arrays["expense_category_codes"]]
+    return period_df[REPORT_TABLE_COLUMNS].iloc[filter_arrays["order"][mask]]
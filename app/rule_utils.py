@@ -0,0 +1,250 @@
+# standard library
+import re
+import time
+from collections import deque
+from typing import Dict, List, Tuple, Union
+# suplementary packages
+import numpy as np
+import pandas as pd
+import yaml
+
+NO_RULE_INDEX = -1
+# sentinel rule index for automaton states where no literal ends
+NO_MATCH = np.iinfo(np.int64).max
+# the libyaml bindings are optional in PyYAML builds. They are several times faster and read and write the same documents
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+YAML_DUMPER = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
+def load_rules_yaml(yaml_str:Union[str, bytes])->Tuple[Dict[str, List[Dict[str, Union[str, bool]]]], str]:
+    """Return the parsed YAML configuration and its top level key, whose value is the list of rules. Duplicate rules are dropped, see dedupe_rules."""
+    yaml_file_dict = yaml.load(yaml_str, Loader=YAML_LOADER)
+    vec_config_dict_key = [*yaml_file_dict.keys()][0]
+    yaml_file_dict[vec_config_dict_key] = dedupe_rules(yaml_file_dict[vec_config_dict_key])
+    return yaml_file_dict, vec_config_dict_key
+
+def get_rule_key(rule_dict:Dict[str, Union[str, bool]])->Tuple[str, bool, bool, bool]:
+    """(description, exact_match, case_sensitive, is_regex), the fields that decide which descriptions a rule matches. Exact match rules ignore the last two."""
+    if rule_dict["exact_match"]:
+        return str(rule_dict["description"]), True, True, False
+    return str(rule_dict["description"]), False, bool(rule_dict.get("case_sensitive", True)), bool(rule_dict.get("is_regex", False))
+
+def get_rule_kind(rule_dict:Dict[str, Union[str, bool]])->str:
+    if rule_dict["exact_match"]:
+        return "exact"
+    return "regex" if rule_dict.get("is_regex", False) else "substring"
+
+def dedupe_rules(rule_list:List[Dict[str, Union[str, bool]]])->List[Dict[str, Union[str, bool]]]:
+    """Drop rules that cannot change any classification.
+    A repeated exact match rule takes the place of its first copy, since compile_rules applies the last one. A repeated substring or regex rule never wins over its first copy."""
+    rule_index = {}
+    deduped_rule_list = []
+    for rule_dict in rule_list:
+        rule_key = get_rule_key(rule_dict)
+        position = rule_index.get(rule_key)
+        if position is None:
+            position = len(deduped_rule_list)
+            rule_index[rule_key] = position
+            deduped_rule_list.append(rule_dict)
+        elif rule_dict["exact_match"]:
+            deduped_rule_list[position] = rule_dict
+    return deduped_rule_list
+
+def build_rule_index(rule_list:List[Dict[str, Union[str, bool]]])->Dict[Tuple[str, bool, bool, bool], int]:
+    """Map the key of every rule in a deduplicated rule list to its position."""
+    return {get_rule_key(rule_dict): i for i, rule_dict in enumerate(rule_list)}
+
+def upsert_rule(rule_list:List[Dict[str, Union[str, bool]]], rule_index:Dict[Tuple[str, bool, bool, bool], int], rule_dict:Dict[str, Union[str, bool]])->int:
+    """Replace the rule with the same key as rule_dict, or append rule_dict. rule_index is updated with rule_list. Returns the rule's position."""
+    rule_key = get_rule_key(rule_dict)
+    position = rule_index.get(rule_key)
+    if position is None:
+        position = len(rule_list)
+        rule_index[rule_key] = position
+        rule_list.append(rule_dict)
+    else:
+        rule_list[position] = rule_dict
+    return position
+
+def dump_rule_yaml(rule_dict:Dict[str, Union[str, bool]])->str:
+    return yaml.dump([rule_dict], Dumper=YAML_DUMPER)
+
+def join_rules_yaml(vec_config_dict_key:str, rule_yaml_list:List[str])->str:
+    """Assemble a configuration file from the dump_rule_yaml text of each rule. The result equals dumping the whole configuration, so after an edit only the changed rules are dumped again."""
+    if not rule_yaml_list:
+        return yaml.dump({vec_config_dict_key: []}, Dumper=YAML_DUMPER)
+    return yaml.dump({vec_config_dict_key: None}, Dumper=YAML_DUMPER).removesuffix(" null\n") + "\n" + "".join(rule_yaml_list)
+
+def build_automaton(pattern_list:List[Tuple[int, str]])->Dict[str, list]:
+    """Build an Aho-Corasick automaton over (rule_index, literal) pairs.
+    Each state keeps the lowest rule index of any literal ending there, so one scan of a string yields the first matching rule in file order."""
+    goto_list = [{}]
+    fail_list = [0]
+    best_list = [NO_MATCH]
+    for rule_index, pattern in pattern_list:
+        state = 0
+        for char in pattern:
+            next_state = goto_list[state].get(char)
+            if next_state is None:
+                next_state = len(goto_list)
+                goto_list[state][char] = next_state
+                goto_list.append({})
+                fail_list.append(0)
+                best_list.append(NO_MATCH)
+            state = next_state
+        best_list[state] = min(best_list[state], rule_index)
+
+    # breadth first pass to set failure links and inherit the best rule of each failure state
+    queue = deque(goto_list[0].values())
+    while queue:
+        state = queue.popleft()
+        for char, next_state in goto_list[state].items():
+            fail_state = fail_list[state]
+            while fail_state and (char not in goto_list[fail_state]):
+                fail_state = fail_list[fail_state]
+            fail_state = goto_list[fail_state].get(char, 0)
+            fail_list[next_state] = fail_state if fail_state!=next_state else 0
+            best_list[next_state] = min(best_list[next_state], best_list[fail_list[next_state]])
+            queue.append(next_state)
+    return {"goto": goto_list, "fail": fail_list, "best": best_list}
+
+def search_automaton(automaton:Dict[str, list], text:str)->int:
+    goto_list, fail_list, best_list = automaton["goto"], automaton["fail"], automaton["best"]
+    state = 0
+    best = best_list[0]
+    for char in text:
+        while state and (char not in goto_list[state]):
+            state = fail_list[state]
+        state = goto_list[state].get(char, 0)
+        if best_list[state] < best:
+            best = best_list[state]
+    return best
+
+def compile_rules(rule_list:List[Dict[str, Union[str, bool]]])->Dict[str, object]:
+    """Sort YAML rules into an exact match hash map, two literal substring automatons (case sensitive and insensitive), and the regex rules that must be evaluated one by one."""
+    exact_rule_dict = {}
+    case_sensitive_list = []
+    case_insensitive_list = []
+    regex_rule_list = []
+    for rule_index, rule_dict in enumerate(rule_list):
+        description = str(rule_dict["description"])
+        case_sensitive = rule_dict.get("case_sensitive", True)
+        if rule_dict["exact_match"]:
+            # a later exact rule overwrites an earlier one for the same description
+            exact_rule_dict[description] = rule_index
+        elif rule_dict.get("is_regex", False):
+            flags = 0 if case_sensitive else re.IGNORECASE
+            regex_rule_list.append((rule_index, re.compile(description, flags=flags)))
+        elif case_sensitive:
+            case_sensitive_list.append((rule_index, description))
+        else:
+            case_insensitive_list.append((rule_index, description.upper()))
+
+    return {
+        "rule_list": rule_list,
+        "exact_rule_dict": exact_rule_dict,
+        "case_sensitive_automaton": build_automaton(case_sensitive_list),
+        "case_insensitive_automaton": build_automaton(case_insensitive_list),
+        "regex_rule_list": regex_rule_list,
+        # YAML reads values such as "vendor: 711" as numbers, which cannot share a sorted categorical with strings
+        "vendor_array": np.array([str(rule_dict["vendor"]) for rule_dict in rule_list], dtype=object),
+        "expense_category_array": np.array([str(rule_dict["expense_category"]) for rule_dict in rule_list], dtype=object),
+    }
+
+def classify_description(compiled_rules:Dict[str, object], description:str, regex_stats:Tuple[np.ndarray, np.ndarray]=None)->int:
+    """Return the index of the rule applied to a description, or NO_RULE_INDEX.
+    Exact match rules take precedence over every other rule. Otherwise the first substring or regex rule in file order wins.
+    With regex_stats, a pair of per rule arrays, each regex evaluation is counted and timed."""
+    if not isinstance(description, str):
+        return NO_RULE_INDEX
+    rule_index = compiled_rules["exact_rule_dict"].get(description)
+    if rule_index is not None:
+        return rule_index
+
+    stripped_description = description.strip()
+    best = min(
+        search_automaton(compiled_rules["case_sensitive_automaton"], stripped_description),
+        search_automaton(compiled_rules["case_insensitive_automaton"], stripped_description.upper())
+        )
+    for rule_index, pattern in compiled_rules["regex_rule_list"]:
+        if rule_index>=best:
+            break
+        if regex_stats is None:
+            found = pattern.search(stripped_description)
+        else:
+            start = time.perf_counter()
+            found = pattern.search(stripped_description)
+            regex_stats[0][rule_index] += 1
+            regex_stats[1][rule_index] += time.perf_counter() - start
+        if found:
+            best = rule_index
+            break
+    return best if best!=NO_MATCH else NO_RULE_INDEX
+
+def get_description_codes(description_series:pd.Series)->Tuple[np.ndarray, pd.Index]:
+    """Return integer codes per row and the distinct descriptions they point to. Missing descriptions have code -1."""
+    if isinstance(description_series.dtype, pd.CategoricalDtype):
+        return description_series.cat.codes.to_numpy(), description_series.cat.categories
+    codes, uniques = pd.factorize(description_series)
+    return codes, pd.Index(uniques)
+
+def map_description_values(description_series:pd.Series, value_series:pd.Series)->np.ndarray:
+    """Broadcast values indexed by distinct description back onto every row through the description codes."""
+    codes, uniques = get_description_codes(description_series)
+    # the extra trailing slot is selected by code -1
+    value_array = np.append(value_series.reindex(uniques).to_numpy(dtype=object), None)
+    return value_array[codes]
+
+def apply_rules(statements_df:pd.DataFrame, compiled_rules:Dict[str, object], rule_timing_dict:Dict[Tuple[str, bool, bool, bool], Dict[str, float]]=None)->pd.DataFrame:
+    """Classify each distinct description once and broadcast the winning rule to its rows.
+    With rule_timing_dict, the evaluations and seconds of each regex rule are added to it under the rule's key."""
+    codes, uniques = get_description_codes(statements_df["Description"])
+    regex_stats = None
+    if rule_timing_dict is not None:
+        num_rules = len(compiled_rules["rule_list"])
+        regex_stats = (np.zeros(num_rules, dtype=np.int64), np.zeros(num_rules, dtype=np.float64))
+    unique_rule_index_list = [classify_description(compiled_rules, description, regex_stats) for description in uniques]
+    if regex_stats is not None:
+        record_regex_stats(rule_timing_dict, compiled_rules["rule_list"], regex_stats)
+    unique_rule_index_array = np.array(unique_rule_index_list + [NO_RULE_INDEX], dtype=np.int64)
+    rule_index_array = unique_rule_index_array[codes]
+    matched = rule_index_array!=NO_RULE_INDEX
+    matched_rule_index_array = rule_index_array[matched]
+    # categorical columns cannot take new values in place, so each column is rebuilt from a full array
+    for column, rule_value_array in [("Vendor_Name", compiled_rules["vendor_array"]), ("Expense_Category", compiled_rules["expense_category_array"])]:
+        value_array = statements_df[column].to_numpy(dtype=object, copy=True)
+        value_array[matched] = rule_value_array[matched_rule_index_array]
+        statements_df[column] = pd.Categorical(value_array)
+    rule_id_array = statements_df["Rule_Id"].to_numpy(dtype=np.int32, copy=True)
+    rule_id_array[matched] = matched_rule_index_array
+    statements_df["Rule_Id"] = rule_id_array
+    statements_df["Rule_Applied_bool"] = statements_df["Rule_Applied_bool"].to_numpy() | matched
+    return statements_df
+
+def record_regex_stats(rule_timing_dict:Dict[Tuple[str, bool, bool, bool], Dict[str, float]], rule_list:List[Dict[str, Union[str, bool]]], regex_stats:Tuple[np.ndarray, np.ndarray]):
+    # keyed by rule key rather than position, so timings survive edits that move rules
+    evaluations_array, seconds_array = regex_stats
+    for rule_index in np.flatnonzero(evaluations_array):
+        timing_dict = rule_timing_dict.setdefault(get_rule_key(rule_list[rule_index]), {"evaluations": 0, "seconds": 0.0})
+        timing_dict["evaluations"] += int(evaluations_array[rule_index])
+        timing_dict["seconds"] += float(seconds_array[rule_index])
+
+def get_rule_stats_df(rule_list:List[Dict[str, Union[str, bool]]], statements_df:pd.DataFrame, rule_timing_dict:Dict[Tuple[str, bool, bool, bool], Dict[str, float]])->pd.DataFrame:
+    """One row per rule with the transactions and distinct descriptions it categorized, from the Rule_Id column, and its regex timings if any were recorded.
+    Rules without matches are candidates for pruning."""
+    rule_id_array = statements_df["Rule_Id"].to_numpy(dtype=np.int64)
+    matched = (rule_id_array>=0) & (rule_id_array<len(rule_list))
+    matched_rule_id_array = rule_id_array[matched]
+    description_codes = get_description_codes(statements_df["Description"])[0][matched]
+    distinct_rule_id_array = pd.DataFrame({"rule_id": matched_rule_id_array, "code": description_codes}).drop_duplicates()["rule_id"].to_numpy()
+    timing_list = [rule_timing_dict.get(get_rule_key(rule_dict), {}) for rule_dict in rule_list]
+    return pd.DataFrame({
+        "Rule_Id": np.arange(len(rule_list)),
+        "Description": [str(rule_dict["description"]) for rule_dict in rule_list],
+        "Kind": [get_rule_kind(rule_dict) for rule_dict in rule_list],
+        "Vendor_Name": [rule_dict["vendor"] for rule_dict in rule_list],
+        "Expense_Category": [rule_dict["expense_category"] for rule_dict in rule_list],
+        "Transactions": np.bincount(matched_rule_id_array, minlength=len(rule_list)),
+        "Descriptions": np.bincount(distinct_rule_id_array, minlength=len(rule_list)),
+        "Regex_Evaluations": [timing_dict.get("evaluations", 0) for timing_dict in timing_list],
+        "Regex_Seconds": [timing_dict.get("seconds", 0.0) for timing_dict in timing_list],
+    })
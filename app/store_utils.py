@@ -0,0 +1,134 @@
+# standard library
+import json
+import os
+import sqlite3
+from contextlib import closing
+from typing import Dict, List, Optional, Tuple, Union
+# suplementary packages
+import pandas as pd
+# custom module(s)
+import constants as c
+import etl_utils as eu
+
+TRANSACTION_COLUMNS = (
+    "Transaction_Date", "Transaction_Type", "Description", "Amount", "Reference_Number", "Statement_Period",
+    "Vendor_Name", "Expense_Category", "Rule_Id", "Rule_Applied_bool"
+    )
+# recorded in each new store as PRAGMA user_version. Bump it whenever SCHEMA_STATEMENTS changes an existing table
+STORE_SCHEMA_VERSION = 1
+SCHEMA_STATEMENTS = (
+    """CREATE TABLE IF NOT EXISTS transactions (
+        Transaction_Id INTEGER PRIMARY KEY,
+        Transaction_Date TEXT,
+        Transaction_Type TEXT,
+        Description TEXT,
+        Amount REAL,
+        Reference_Number TEXT,
+        Statement_Period TEXT,
+        Vendor_Name TEXT,
+        Expense_Category TEXT,
+        Rule_Id INTEGER,
+        Rule_Applied_bool INTEGER
+    )""",
+    # serves the per-description updates written when rules change. Reports filter statements_df in memory, so nothing else is indexed
+    "CREATE INDEX IF NOT EXISTS transactions_description_index ON transactions (Description)",
+    """CREATE TABLE IF NOT EXISTS rules (
+        Rule_Index INTEGER PRIMARY KEY,
+        Rule_json TEXT
+    )""",
+    """CREATE TABLE IF NOT EXISTS store_metadata (
+        Key TEXT PRIMARY KEY,
+        Value TEXT
+    )""",
+)
+
+def connect_store(store_path:str=c.TRANSACTION_STORE_PATH)->sqlite3.Connection:
+    os.makedirs(os.path.dirname(store_path), exist_ok=True)
+    connection = sqlite3.connect(store_path)
+    for statement in SCHEMA_STATEMENTS:
+        connection.execute(statement)
+    if connection.execute("PRAGMA user_version").fetchone()[0]==0:
+        connection.execute(f"PRAGMA user_version = {STORE_SCHEMA_VERSION}")
+    return connection
+
+def to_store_rows(statements_df:pd.DataFrame, first_transaction_id:int):
+    store_df = statements_df[list(TRANSACTION_COLUMNS)].astype(object)
+    # sqlite has no date type, so dates are stored as ISO strings which keep their order when compared
+    store_df["Transaction_Date"] = statements_df["Transaction_Date"].dt.strftime("%Y-%m-%d").astype(object)
+    store_df["Rule_Id"] = statements_df["Rule_Id"].astype(int)
+    store_df["Rule_Applied_bool"] = statements_df["Rule_Applied_bool"].astype(int)
+    store_df = store_df.where(store_df.notna(), None)
+    transaction_ids = range(first_transaction_id, first_transaction_id + len(store_df))
+    return [(transaction_id, *row) for transaction_id, row in zip(transaction_ids, store_df.itertuples(index=False, name=None))]
+
+def insert_transactions(connection:sqlite3.Connection, statements_df:pd.DataFrame, first_transaction_id:int):
+    placeholders = ", ".join(["?"]*(len(TRANSACTION_COLUMNS) + 1))
+    connection.executemany(
+        f"INSERT INTO transactions (Transaction_Id, {', '.join(TRANSACTION_COLUMNS)}) VALUES ({placeholders})",
+        to_store_rows(statements_df, first_transaction_id)
+        )
+
+def replace_transactions(statements_df:pd.DataFrame, store_path:str=c.TRANSACTION_STORE_PATH):
+    """Replace every stored transaction. Transaction_Id is the row position in statements_df."""
+    with closing(connect_store(store_path)) as connection, connection:
+        connection.execute("DELETE FROM transactions")
+        insert_transactions(connection, statements_df, 0)
+
+def append_transactions(new_statements_df:pd.DataFrame, first_transaction_id:int, store_path:str=c.TRANSACTION_STORE_PATH):
+    with closing(connect_store(store_path)) as connection, connection:
+        insert_transactions(connection, new_statements_df, first_transaction_id)
+
+def update_vendor_expense(dvec_df:pd.DataFrame, store_path:str=c.TRANSACTION_STORE_PATH):
+    """Write the vendor name and expense category of each description in dvec_df to its stored transactions."""
+    rows = [(vendor_name, expense_category, description) for description, vendor_name, expense_category in dvec_df[["Description", "Vendor_Name", "Expense_Category"]].itertuples(index=False, name=None)]
+    with closing(connect_store(store_path)) as connection, connection:
+        connection.executemany("UPDATE transactions SET Vendor_Name = ?, Expense_Category = ? WHERE Description = ?", rows)
+
+def clear_store(store_path:str=c.TRANSACTION_STORE_PATH):
+    with closing(connect_store(store_path)) as connection, connection:
+        for table_name in ["transactions", "rules", "store_metadata"]:
+            connection.execute(f"DELETE FROM {table_name}")
+
+def from_store_df(store_df:pd.DataFrame)->pd.DataFrame:
+    # dates are stored as text, so they are parsed with the known format before the rest of the schema is applied
+    store_df["Transaction_Date"] = pd.to_datetime(store_df["Transaction_Date"], format="%Y-%m-%d", errors="coerce")
+    return eu.enforce_statements_schema(store_df)
+
+def load_transactions(store_path:str=c.TRANSACTION_STORE_PATH)->Optional[pd.DataFrame]:
+    if not os.path.exists(store_path):
+        return None
+    with closing(connect_store(store_path)) as connection:
+        store_df = pd.read_sql_query(f"SELECT {', '.join(TRANSACTION_COLUMNS)} FROM transactions ORDER BY Transaction_Id", connection)
+    if store_df.empty:
+        return None
+    return from_store_df(store_df)
+
+def save_rules(yaml_file_dict:Dict[str, List[Dict[str, Union[str, bool]]]], vec_config_dict_key:str, store_path:str=c.TRANSACTION_STORE_PATH):
+    rule_list = yaml_file_dict[vec_config_dict_key]
+    with closing(connect_store(store_path)) as connection, connection:
+        connection.execute("DELETE FROM rules")
+        connection.executemany("INSERT INTO rules (Rule_Index, Rule_json) VALUES (?, ?)", [(i, json.dumps(rule_dict)) for i, rule_dict in enumerate(rule_list)])
+        connection.execute("INSERT OR REPLACE INTO store_metadata (Key, Value) VALUES ('vec_config_dict_key', ?)", (vec_config_dict_key,))
+
+def upsert_rules(rule_rows:List[Tuple[int, Dict[str, Union[str, bool]]]], vec_config_dict_key:str, store_path:str=c.TRANSACTION_STORE_PATH):
+    """Write only added or changed rules, as (position in the rule list, rule) pairs."""
+    with closing(connect_store(store_path)) as connection, connection:
+        connection.executemany("INSERT OR REPLACE INTO rules (Rule_Index, Rule_json) VALUES (?, ?)", [(int(i), json.dumps(rule_dict)) for i, rule_dict in rule_rows])
+        connection.execute("INSERT OR REPLACE INTO store_metadata (Key, Value) VALUES ('vec_config_dict_key', ?)", (vec_config_dict_key,))
+
+def update_rule_ids(description_rule_rows:List[Tuple[str, int]], store_path:str=c.TRANSACTION_STORE_PATH):
+    """Mark the stored transactions of each description as categorized by the rule at the given position."""
+    with closing(connect_store(store_path)) as connection, connection:
+        connection.executemany("UPDATE transactions SET Rule_Id = ?, Rule_Applied_bool = 1 WHERE Description = ?", [(int(rule_id), description) for description, rule_id in description_rule_rows])
+
+def load_rules(store_path:str=c.TRANSACTION_STORE_PATH):
+    """Return (yaml_file_dict, vec_config_dict_key) for the stored rules, or (None, None) if no rules were stored."""
+    if not os.path.exists(store_path):
+        return None, None
+    with closing(connect_store(store_path)) as connection:
+        key_row = connection.execute("SELECT Value FROM store_metadata WHERE Key = 'vec_config_dict_key'").fetchone()
+        rule_rows = connection.execute("SELECT Rule_json FROM rules ORDER BY Rule_Index").fetchall()
+    if key_row is None:
+        return None, None
+    vec_config_dict_key = key_row[0]
+    return {vec_config_dict_key: [json.loads(rule_json) for (rule_json,) in rule_rows]}, vec_config_dict_key
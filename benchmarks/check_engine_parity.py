@@ -0,0 +1,78 @@
+# standard library
+import argparse
+import glob
+import os
+import sys
+import time
+# suplementary packages
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+# custom module(s)
+import constants as c
+import etl_utils as eu
+import extraction_utils as xu
+import statement_generator as sg
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Check that every installed extraction engine parses statements exactly like the default PyPDF2 engine.")
+    parser.add_argument("statement_dir", nargs="?", help="Directory of real PDF e-statements to check. Synthetic statements are used when omitted.")
+    parser.add_argument("--count", type=int, default=24, help="Number of synthetic statements to generate when no directory is given.")
+    return parser.parse_args(argv)
+
+def get_statement_bytes_list(statement_dir, count:int):
+    if statement_dir:
+        pdf_path_list = sorted(glob.glob(os.path.join(statement_dir, "**", "*.pdf"), recursive=True))
+        statement_bytes_list = []
+        for pdf_path in pdf_path_list:
+            with open(pdf_path, "rb") as pdf_file:
+                statement_bytes_list.append((os.path.basename(pdf_path), pdf_file.read()))
+        return statement_bytes_list
+    description_pool = sg.get_description_pool(400)
+    return [
+        (f"synthetic_{year}_{month:02d}.pdf", sg.generate_statement_pdf(year, month, 60 + 20*(i % 10), description_pool, seed=i))
+        for i, (year, month) in enumerate(sg.iter_statement_months(count))
+        ]
+
+def parse_all(statement_bytes_list, engine:str, stop_after_sections:bool):
+    # one untimed parse loads the engine and compiles everything the first parse would otherwise pay for
+    eu.parse_statement_bytes(statement_bytes_list[0][1], engine, stop_after_sections)
+    start = time.perf_counter()
+    result_list = [eu.parse_statement_bytes(file_bytes, engine, stop_after_sections) for _, file_bytes in statement_bytes_list]
+    return result_list, time.perf_counter() - start
+
+def get_mismatch_str(baseline_result, result):
+    (baseline_df, baseline_error_str), (statement_df, error_str) = baseline_result, result
+    if (baseline_df is None) or (statement_df is None):
+        return None if (baseline_df is None) and (statement_df is None) else f"baseline error: {baseline_error_str} engine error: {error_str}"
+    try:
+        pd.testing.assert_frame_equal(baseline_df, statement_df)
+    except AssertionError as e:
+        return str(e).splitlines()[0]
+    return None
+
+def main(argv=None):
+    args = parse_args(argv)
+    statement_bytes_list = get_statement_bytes_list(args.statement_dir, args.count)
+    if not statement_bytes_list:
+        print("No statements found.")
+        return 1
+    baseline_results, baseline_seconds = parse_all(statement_bytes_list, c.DEFAULT_EXTRACTION_ENGINE, False)
+    print(f"{'engine':<12}{'stop after sections':>21}{'seconds':>10}{'speedup':>10}{'mismatches':>12}")
+    num_mismatches = 0
+    for engine in xu.get_available_engines():
+        for stop_after_sections in [False, True]:
+            result_list, seconds = parse_all(statement_bytes_list, engine, stop_after_sections)
+            mismatch_list = [
+                (file_name, get_mismatch_str(baseline_result, result))
+                for (file_name, _), baseline_result, result in zip(statement_bytes_list, baseline_results, result_list)
+                ]
+            mismatch_list = [(file_name, mismatch_str) for file_name, mismatch_str in mismatch_list if mismatch_str]
+            num_mismatches += len(mismatch_list)
+            print(f"{engine:<12}{str(stop_after_sections):>21}{seconds:>10.3f}{baseline_seconds/seconds:>9.2f}x{len(mismatch_list):>12}")
+            for file_name, mismatch_str in mismatch_list[:5]:
+                print(f"    {file_name}: {mismatch_str}")
+    return 1 if num_mismatches else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+# standard library
+import argparse
+import os
+import random
+import re
+import sys
+# suplementary packages
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+# custom module(s)
+import rule_utils as ru
+import statement_generator as sg
+
+# a small alphabet makes literals overlap, nest inside each other and differ only in case
+OVERLAP_ALPHABET = "ABab"
+REGEX_TEMPLATE_LIST = [r"^{0}", r"{0}$", r"{0}.*\d", r"\d{{4}} {0}", r"{0}|ZZZ", r"[A-Z]+ {0}"]
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Check that compiled rule matching categorizes descriptions exactly like applying each rule in turn.")
+    parser.add_argument("--trials", type=int, default=200, help="Number of random rule files to check.")
+    parser.add_argument("--rules", type=int, default=40, help="Rules per random rule file.")
+    parser.add_argument("--descriptions", type=int, default=300, help="Descriptions per trial.")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argv)
+
+def apply_rules_naive(description_series:pd.Series, rule_list):
+    """Return the rule index applied to each description by matching one rule at a time in file order, like the app did before rules were compiled."""
+    rule_id_array = np.full(len(description_series), ru.NO_RULE_INDEX, dtype=np.int64)
+    stripped_series = description_series.str.strip()
+    for i, rule_dict in enumerate(rule_list):
+        if rule_dict["exact_match"]:
+            # exact rules overwrite whatever was applied before them
+            condition = (description_series==rule_dict["description"]).to_numpy(dtype=bool)
+        else:
+            is_match = stripped_series.str.contains(rule_dict["description"], case=rule_dict["case_sensitive"], regex=rule_dict["is_regex"], na=False)
+            condition = is_match.to_numpy(dtype=bool) & (rule_id_array==ru.NO_RULE_INDEX)
+        rule_id_array[condition] = i
+    return rule_id_array
+
+def apply_rules_compiled(description_series:pd.Series, rule_list):
+    statements_df = pd.DataFrame({
+        "Description": description_series.astype("category"),
+        "Vendor_Name": pd.Categorical([""]*len(description_series)),
+        "Expense_Category": pd.Categorical([""]*len(description_series)),
+        "Rule_Id": np.full(len(description_series), ru.NO_RULE_INDEX, dtype=np.int32),
+        "Rule_Applied_bool": np.zeros(len(description_series), dtype=bool),
+    })
+    return ru.apply_rules(statements_df, ru.compile_rules(rule_list))["Rule_Id"].to_numpy(dtype=np.int64)
+
+def get_random_literal(rng:random.Random, description_list):
+    if rng.random()<0.5:
+        return "".join(rng.choice(OVERLAP_ALPHABET) for _ in range(rng.randint(1, 4)))
+    description = rng.choice(description_list).strip() or rng.choice(OVERLAP_ALPHABET)
+    start = rng.randrange(len(description))
+    literal = description[start:start + rng.randint(1, 8)]
+    return literal.lower() if rng.random()<0.3 else literal
+
+def get_random_rule(rng:random.Random, description_list, i:int):
+    rule_dict = {"vendor": f"Vendor {i}", "expense_category": f"Category {i % 5}", "exact_match": False, "case_sensitive": rng.random()<0.5, "is_regex": False}
+    kind = rng.random()
+    if kind<0.2:
+        rule_dict.update({"description": rng.choice(description_list), "exact_match": True, "case_sensitive": True})
+    elif kind<0.4:
+        rule_dict.update({"description": rng.choice(REGEX_TEMPLATE_LIST).format(re.escape(get_random_literal(rng, description_list))), "is_regex": True})
+    else:
+        rule_dict["description"] = get_random_literal(rng, description_list)
+    return rule_dict
+
+def get_random_descriptions(rng:random.Random, description_pool, num_descriptions:int):
+    description_list = []
+    for _ in range(num_descriptions):
+        kind = rng.random()
+        if kind<0.6:
+            description = rng.choice(description_pool)
+        elif kind<0.75:
+            description = rng.choice(description_pool).lower()
+        elif kind<0.9:
+            description = "".join(rng.choice(OVERLAP_ALPHABET + " ") for _ in range(rng.randint(1, 12)))
+        else:
+            # surrounding whitespace is stripped for substring and regex rules, but not for exact rules
+            description = f"  {rng.choice(description_pool)} "
+        description_list.append(description)
+    return description_list
+
+def get_fixed_cases():
+    """(name, descriptions, rules) for the cases the random trials should cover, spelled out."""
+    def rule(description, exact_match=False, case_sensitive=True, is_regex=False, i=0):
+        return {"description": description, "vendor": f"Vendor {i}", "expense_category": "Category", "exact_match": exact_match, "case_sensitive": case_sensitive, "is_regex": is_regex}
+    description_list = ["KROGER 1315 ATHENS GA", "kroger 1315 athens ga", "SHELL OIL 8675", "ABABAB", "  PUBLIX 1529 ATLANTA  ", "UBER *TRIP 3351"]
+    return [
+        ("overlapping keywords", description_list, [rule("BABA", i=0), rule("ABAB", i=1), rule("AB", i=2), rule("OIL 86", i=3), rule("SHELL", i=4)]),
+        ("nested keywords", description_list, [rule("KROGER 1315", i=0), rule("ROGER", i=1), rule("KROGER", i=2)]),
+        ("case sensitivity", description_list, [rule("kroger", i=0), rule("KROGER", case_sensitive=False, i=1), rule("athens", case_sensitive=False, i=2)]),
+        ("regex rules", description_list, [rule(r"\*TRIP", is_regex=True, i=0), rule(r"^publix", is_regex=True, case_sensitive=False, i=1), rule(r"\d{4}$", is_regex=True, i=2), rule("TRIP", i=3)]),
+        ("rule priority", description_list, [rule("ATHENS", i=0), rule("KROGER 1315 ATHENS GA", exact_match=True, i=1), rule("KROGER", i=2), rule("KROGER 1315 ATHENS GA", exact_match=True, i=3), rule(r"SHELL", is_regex=True, i=4), rule("SHELL", i=5)]),
+        ("whitespace", description_list, [rule("PUBLIX 1529 ATLANTA", exact_match=True, i=0), rule("PUBLIX 1529 ATLANTA", i=1), rule(r"^PUBLIX", is_regex=True, i=2)]),
+    ]
+
+def get_mismatch_count(description_list, rule_list):
+    description_series = pd.Series(description_list, dtype=object)
+    return int((apply_rules_naive(description_series, rule_list)!=apply_rules_compiled(description_series, rule_list)).sum())
+
+def main(argv=None):
+    args = parse_args(argv)
+    num_mismatches = 0
+    print(f"{'case':<24}{'rules':>8}{'descriptions':>14}{'mismatches':>12}")
+    for case_name, description_list, rule_list in get_fixed_cases():
+        mismatch_count = get_mismatch_count(description_list, rule_list)
+        num_mismatches += mismatch_count
+        print(f"{case_name:<24}{len(rule_list):>8}{len(description_list):>14}{mismatch_count:>12}")
+
+    rng = random.Random(args.seed)
+    description_pool = sg.get_description_pool(50, seed=args.seed)
+    random_mismatches = 0
+    for _ in range(args.trials):
+        description_list = get_random_descriptions(rng, description_pool, args.descriptions)
+        rule_list = [get_random_rule(rng, description_list, i) for i in range(args.rules)]
+        random_mismatches += get_mismatch_count(description_list, rule_list)
+    num_mismatches += random_mismatches
+    print(f"{f'random x{args.trials}':<24}{args.rules:>8}{args.descriptions:>14}{random_mismatches:>12}")
+    return 1 if num_mismatches else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,172 @@
+# standard library
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Dict, List
+# suplementary packages
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+# custom module(s)
+import constants as c
+import etl_utils as eu
+import report_utils as rpu
+import rule_utils as ru
+import statement_generator as sg
+
+DEFAULT_STATEMENT_SCALES = [1, 10, 100, 1000]
+DEFAULT_RULE_SCALES = [10, 100, 1000, 10000]
+TRANSACTIONS_PER_STATEMENT = 60
+DESCRIPTION_POOL_SIZE = 400
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Time each stage of the statement pipeline on synthetic Bank of America statements.")
+    parser.add_argument("--statement-scales", type=int, nargs="+", default=DEFAULT_STATEMENT_SCALES, help="Numbers of monthly statements to generate.")
+    parser.add_argument("--rule-scales", type=int, nargs="+", default=DEFAULT_RULE_SCALES, help="Numbers of vendor/expense rules to generate.")
+    parser.add_argument("--output", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "results", "latest.json"), help="Where to write the json results.")
+    parser.add_argument("--compare", help="A previous json results file. Each stage is reported as a ratio against it.")
+    parser.add_argument("--engine", default=c.DEFAULT_EXTRACTION_ENGINE, help="PDF text extraction engine timed by the extract_pdf_text stage.")
+    parser.add_argument("--skip-pdf", action="store_true", help="Skip PDF generation and text extraction, which dominate run time at large scales.")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc pass that measures peak memory.")
+    return parser.parse_args(argv)
+
+@contextmanager
+def patch_timer(module, function_name:str, elapsed_list:List[float]):
+    """Accumulate the time spent in module.function_name while it is called from inside another stage."""
+    function = getattr(module, function_name)
+    def timed_function(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            elapsed_list.append(time.perf_counter() - start)
+    setattr(module, function_name, timed_function)
+    try:
+        yield
+    finally:
+        setattr(module, function_name, function)
+
+def measure(stage_function:Callable, measure_memory:bool):
+    """Return (result, seconds, peak_mib). Peak memory comes from a second, traced run so tracing does not distort the timing."""
+    start = time.perf_counter()
+    result = stage_function()
+    seconds = time.perf_counter() - start
+    peak_mib = None
+    if measure_memory:
+        tracemalloc.start()
+        stage_function()
+        peak_mib = tracemalloc.get_traced_memory()[1]/(1024*1024)
+        tracemalloc.stop()
+    return result, seconds, peak_mib
+
+def make_result(stage:str, num_statements:int, num_rules:int, num_rows:int, seconds:float, peak_mib)->Dict[str, object]:
+    return {
+        "stage": stage,
+        "statements": num_statements,
+        "rules": num_rules,
+        "rows": num_rows,
+        "seconds": seconds,
+        "statements_per_second": num_statements/seconds if seconds else None,
+        "rows_per_second": num_rows/seconds if seconds else None,
+        "peak_mib": peak_mib,
+    }
+
+def benchmark_statements(num_statements:int, description_pool:List[str], skip_pdf:bool, engine:str, measure_memory:bool):
+    month_list = list(sg.iter_statement_months(num_statements))
+    text_list = [sg.generate_statement_text(year, month, TRANSACTIONS_PER_STATEMENT, description_pool, seed=i) for i, (year, month) in enumerate(month_list)]
+    results = []
+
+    if not skip_pdf:
+        pdf_list = [sg.generate_statement_pdf(year, month, TRANSACTIONS_PER_STATEMENT, description_pool, seed=i) for i, (year, month) in enumerate(month_list)]
+        _, seconds, peak_mib = measure(lambda: [eu.extract_pdf_bytes_text(pdf_bytes, engine) for pdf_bytes in pdf_list], measure_memory)
+        results.append(make_result("extract_pdf_text", num_statements, 0, 0, seconds, peak_mib))
+
+    scan_elapsed, clean_elapsed = [], []
+    with patch_timer(eu, "collect_statement_rows", scan_elapsed), patch_timer(eu, "clean_statement", clean_elapsed):
+        statement_df_list, seconds, peak_mib = measure(lambda: [eu.get_statement_df(pdf_text) for pdf_text in text_list], measure_memory)
+    num_rows = sum(len(statement_df) for statement_df in statement_df_list)
+    # the patched stages ran once per statement in the timed pass and again in the traced pass
+    num_timed_calls = len(text_list)
+    results.append(make_result("get_statement_df", num_statements, 0, num_rows, seconds, peak_mib))
+    results.append(make_result("collect_statement_rows", num_statements, 0, num_rows, sum(scan_elapsed[:num_timed_calls]), None))
+    results.append(make_result("clean_statement", num_statements, 0, num_rows, sum(clean_elapsed[:num_timed_calls]), None))
+
+    statements_df, seconds, peak_mib = measure(lambda: eu.build_statements_df(statement_df_list), measure_memory)
+    results.append(make_result("build_statements_df", num_statements, 0, num_rows, seconds, peak_mib))
+    return statements_df, results
+
+def benchmark_reports(statements_df:pd.DataFrame, num_statements:int, measure_memory:bool):
+    def build_reports():
+        for freq in ["M", "Q"]:
+            period_index = rpu.build_period_index(statements_df, freq)
+            for positions in period_index.values():
+                rpu.build_period_aggregates(statements_df.iloc[positions])
+    _, seconds, peak_mib = measure(build_reports, measure_memory)
+    return [make_result("report_aggregations", num_statements, 0, len(statements_df), seconds, peak_mib)]
+
+def benchmark_rules(statements_df:pd.DataFrame, num_statements:int, num_rules:int, description_pool:List[str], measure_memory:bool):
+    rule_list = sg.generate_rules(num_rules, description_pool)
+    compiled_rules, seconds, peak_mib = measure(lambda: ru.compile_rules(rule_list), measure_memory)
+    results = [make_result("compile_rules", num_statements, num_rules, 0, seconds, peak_mib)]
+    _, seconds, peak_mib = measure(lambda: ru.apply_rules(statements_df.copy(), compiled_rules), measure_memory)
+    results.append(make_result("assign_vec", num_statements, num_rules, len(statements_df), seconds, peak_mib))
+    return results
+
+def compare_results(result_list:List[Dict[str, object]], baseline_path:str):
+    with open(baseline_path) as baseline_file:
+        baseline_list = json.load(baseline_file)["results"]
+    baseline_dict = {(result["stage"], result["statements"], result["rules"]): result for result in baseline_list}
+    print(f"\nComparison against {baseline_path} (ratio > 1 is slower than the baseline)")
+    for result in result_list:
+        baseline = baseline_dict.get((result["stage"], result["statements"], result["rules"]))
+        if baseline and baseline["seconds"]:
+            print(f"{result['stage']:<24} statements={result['statements']:<6} rules={result['rules']:<6} {result['seconds']/baseline['seconds']:.2f}x")
+
+def print_results(result_list:List[Dict[str, object]]):
+    print(f"{'stage':<24}{'statements':>11}{'rules':>8}{'rows':>9}{'seconds':>11}{'rows/s':>12}{'peak MiB':>10}")
+    for result in result_list:
+        rows_per_second = f"{result['rows_per_second']:,.0f}" if result["rows"] and result["rows_per_second"] else "-"
+        peak_mib = f"{result['peak_mib']:.1f}" if result["peak_mib"] is not None else "-"
+        print(f"{result['stage']:<24}{result['statements']:>11}{result['rules']:>8}{result['rows']:>9}{result['seconds']:>11.4f}{rows_per_second:>12}{peak_mib:>10}")
+
+def main(argv=None):
+    args = parse_args(argv)
+    measure_memory = not args.no_memory
+    description_pool = sg.get_description_pool(DESCRIPTION_POOL_SIZE)
+    result_list = []
+    statements_df = None
+    for num_statements in args.statement_scales:
+        statements_df, results = benchmark_statements(num_statements, description_pool, args.skip_pdf, args.engine, measure_memory)
+        result_list.extend(results)
+        result_list.extend(benchmark_reports(statements_df, num_statements, measure_memory))
+    # rule scaling runs against the largest statement set
+    for num_rules in args.rule_scales:
+        result_list.extend(benchmark_rules(statements_df, args.statement_scales[-1], num_rules, description_pool, measure_memory))
+
+    print_results(result_list)
+    output = {
+        "metadata": {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "engine": args.engine,
+            "platform": platform.platform(),
+            "transactions_per_statement": TRANSACTIONS_PER_STATEMENT,
+        },
+        "results": result_list,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as output_file:
+        json.dump(output, output_file, indent=2)
+    print(f"\nWrote results to {args.output}")
+    if args.compare:
+        compare_results(result_list, args.compare)
+
+if __name__ == "__main__":
+    main()
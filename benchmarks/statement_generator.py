@@ -0,0 +1,164 @@
+# standard library
+import calendar
+import random
+from datetime import date, timedelta
+from typing import Dict, List, Union
+
+MERCHANT_LIST = [
+    "PUBLIX", "KROGER", "WM SUPERCENTER", "WAL-MART", "TACO BELL", "SUBWAY", "RACETRAC", "5GUYS", "CHICK-FIL-A",
+    "STARBUCKS STORE", "SHELL OIL", "QT", "HOME DEPOT", "LOWES", "TARGET", "COSTCO WHSE", "NETFLIX.COM", "SPOTIFY USA",
+    "AMZN Mktp US*", "AMAZON.COM*", "UBER *TRIP", "DELTA AIR", "MARTA", "CVS/PHARMACY", "WALGREENS", "Pet Supplies Plus",
+]
+CITY_LIST = ["ATHENS GA", "ATLANTA GA", "DECATUR GA", "MARIETTA GA", "SEATTLE WA", "AMZN.COM/BILL WA"]
+PAGE_LINE_COUNT = 45
+# boilerplate printed after the transaction sections, as on the last pages of real statements
+NOTICE_LINE_LIST = [
+    "Important Information About Your Account",
+    "Interest charges are calculated using the daily balance method, including new transactions.",
+    "How to avoid paying interest on purchases: pay your new balance in full by the payment due date.",
+    "Billing rights summary: tell us about errors or questions about your bill within 60 days.",
+    "Your rights if you are dissatisfied with your credit card purchases are described below.",
+    "Annual percentage rate for purchases is a variable rate based on the prime rate.",
+]
+
+def get_description_pool(num_descriptions:int, seed:int=0)->List[str]:
+    """Merchant descriptions as they appear on statements: merchant, store number and city. A small pool makes descriptions repeat like real spending."""
+    rng = random.Random(seed)
+    description_set = set()
+    while len(description_set)<num_descriptions:
+        description_set.add(f"{rng.choice(MERCHANT_LIST)} {rng.randint(1, 9999):04d} {rng.choice(CITY_LIST)}")
+    return sorted(description_set)
+
+def format_amount(amount:float)->str:
+    return f"{amount:,.2f}"
+
+def format_transaction_lines(transaction_date:date, description:str, amount:float, rng:random.Random, multiline:bool)->List[str]:
+    posting_date = transaction_date + timedelta(days=rng.randint(0, 2))
+    date_str = f"{transaction_date:%m/%d} {posting_date:%m/%d}"
+    reference_number, account_number = f"{rng.randint(0, 9999):04d}", f"{rng.randint(0, 9999):04d}"
+    if multiline:
+        # the amount and reference numbers wrap onto a second line, as long descriptions do on real statements
+        return [f"{date_str} {description} MKTP ORDER #{rng.randint(100000, 999999)}", f"CONTINUED {reference_number} {account_number} {format_amount(amount)}"]
+    return [f"{date_str} {description} {reference_number} {account_number} {format_amount(amount)}"]
+
+def generate_statement_lines(year:int, month:int, num_transactions:int, description_pool:List[str], seed:int=0, multiline_rate:float=0.05, num_notice_lines:int=2*PAGE_LINE_COUNT)->List[str]:
+    """Lines of one statement closing on the 27th of year/month, following the section markers in constants.py.
+    A statement closing in January covers December 28 of the previous year, exercising the year rollover.
+    num_notice_lines lines of account notices follow the last transaction section."""
+    rng = random.Random(seed)
+    end_date = date(year, month, 27)
+    start_date = (end_date.replace(day=1) - timedelta(days=1)).replace(day=28)
+    num_days = (end_date - start_date).days
+
+    debit_lines = []
+    debit_total = 0.0
+    for _ in range(num_transactions):
+        transaction_date = start_date + timedelta(days=rng.randint(0, num_days - 2))
+        amount = round(rng.lognormvariate(3.2, 1.0), 2)
+        debit_total += amount
+        debit_lines.extend(format_transaction_lines(transaction_date, rng.choice(description_pool), amount, rng, rng.random()<multiline_rate))
+    payment = round(debit_total*rng.uniform(0.5, 1.0), 2)
+
+    summary_lines = [
+        "Bank of America",
+        "Account Summary",
+        f"{calendar.month_name[start_date.month]} {start_date.day} - {calendar.month_name[end_date.month]} {end_date.day}, {end_date.year}",
+        f"Payment Due Date {end_date + timedelta(days=28):%m/%d/%Y}",
+        f"Payments and Other Credits -${format_amount(payment)}",
+        f"Purchases and Adjustments ${format_amount(debit_total)}",
+        f"Interest Charged $0.00",
+    ]
+    credit_lines = [
+        "Payments and Other Credits",
+        "Transaction Date Posting Date Description Reference Number Account Number Amount",
+        f"{start_date + timedelta(days=5):%m/%d} {start_date + timedelta(days=5):%m/%d} PAYMENT - THANK YOU {rng.randint(0, 9999):04d} {rng.randint(0, 9999):04d} -{format_amount(payment)}",
+        f"TOTAL PAYMENTS AND OTHER CREDITS FOR THIS PERIOD -${format_amount(payment)}",
+    ]
+    debit_lines = (
+        ["Purchases and Adjustments", "Transaction Date Posting Date Description Reference Number Account Number Amount"]
+        + debit_lines
+        + [f"TOTAL PURCHASES AND ADJUSTMENTS FOR THIS PERIOD ${format_amount(debit_total)}"]
+    )
+    interest_lines = [
+        "Interest Charged",
+        f"{end_date:%m/%d} {end_date:%m/%d} INTEREST CHARGED ON PURCHASES 0.00",
+        "TOTAL INTEREST CHARGED FOR THIS PERIOD $0.00",
+    ]
+    notice_lines = [NOTICE_LINE_LIST[i % len(NOTICE_LINE_LIST)] for i in range(num_notice_lines)]
+    return summary_lines + credit_lines + debit_lines + interest_lines + notice_lines
+
+def paginate_lines(line_list:List[str])->List[List[str]]:
+    """Split statement lines into pages. Each page ends with a "Page i of n" footer, and a section split across pages repeats its header."""
+    section_header_list = ["Payments and Other Credits", "Purchases and Adjustments", "Interest Charged"]
+    page_list = []
+    open_section_header = None
+    for i in range(0, len(line_list), PAGE_LINE_COUNT):
+        page_lines = [f"{open_section_header} (Continued)"] if open_section_header else []
+        for line in line_list[i:i + PAGE_LINE_COUNT]:
+            if line in section_header_list:
+                open_section_header = line
+            elif line.startswith("TOTAL "):
+                open_section_header = None
+            page_lines.append(line)
+        page_list.append(page_lines)
+    for i, page_lines in enumerate(page_list):
+        page_lines.append(f"Page {i + 1} of {len(page_list)}")
+    return page_list
+
+def generate_statement_text(year:int, month:int, num_transactions:int, description_pool:List[str], seed:int=0)->str:
+    return "\n".join("\n".join(page_lines) for page_lines in paginate_lines(generate_statement_lines(year, month, num_transactions, description_pool, seed)))
+
+def escape_pdf_text(text:str)->str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def make_pdf(page_list:List[List[str]])->bytes:
+    """Write a minimal PDF with one Helvetica text line per statement line."""
+    object_list = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [{}] /Count {} >>".format(" ".join(f"{4 + 2*i} 0 R" for i in range(len(page_list))), len(page_list)),
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for i, page_lines in enumerate(page_list):
+        stream = "BT /F1 9 Tf 11 TL 36 760 Td " + " ".join(f"({escape_pdf_text(line)}) Tj T*" for line in page_lines) + " ET"
+        object_list.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2*i} 0 R >>")
+        object_list.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+
+    pdf_bytes = b"%PDF-1.4\n"
+    offset_list = []
+    for i, pdf_object in enumerate(object_list):
+        offset_list.append(len(pdf_bytes))
+        pdf_bytes += f"{i + 1} 0 obj\n{pdf_object}\nendobj\n".encode("latin-1")
+    xref_offset = len(pdf_bytes)
+    pdf_bytes += f"xref\n0 {len(object_list) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    pdf_bytes += "".join(f"{offset:010d} 00000 n \n" for offset in offset_list).encode("latin-1")
+    pdf_bytes += f"trailer\n<< /Size {len(object_list) + 1} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode("latin-1")
+    return pdf_bytes
+
+def generate_statement_pdf(year:int, month:int, num_transactions:int, description_pool:List[str], seed:int=0)->bytes:
+    return make_pdf(paginate_lines(generate_statement_lines(year, month, num_transactions, description_pool, seed)))
+
+def iter_statement_months(num_statements:int, end_year:int=2024, end_month:int=12):
+    """(year, month) of num_statements consecutive monthly statements ending at end_year/end_month, oldest first."""
+    first_month_index = end_year*12 + end_month - num_statements
+    for month_index in range(first_month_index, first_month_index + num_statements):
+        year, month_offset = divmod(month_index, 12)
+        yield year, month_offset + 1
+
+def generate_rules(num_rules:int, description_pool:List[str], seed:int=0)->List[Dict[str, Union[str, bool]]]:
+    """Rules shaped like a grown YAML configuration: mostly exact matches, some literal substrings and a few regex patterns."""
+    rng = random.Random(seed)
+    rule_list = []
+    for i in range(num_rules):
+        kind = rng.random()
+        if kind<0.7:
+            rule_dict = {"description": rng.choice(description_pool), "exact_match": True}
+        elif kind<0.95:
+            # a few bare merchant names match many descriptions, the rest target one store number
+            merchant = rng.choice(MERCHANT_LIST)
+            literal = merchant if rng.random()<0.1 else f"{merchant} {rng.randint(1, 9999):04d}"
+            rule_dict = {"description": literal, "exact_match": False, "case_sensitive": rng.random()<0.8, "is_regex": False}
+        else:
+            rule_dict = {"description": rf"^{rng.choice(MERCHANT_LIST)[:4]}.*\s{rng.randint(0, 9)}\d{{3}}\s", "exact_match": False, "case_sensitive": True, "is_regex": True}
+        rule_dict.update({"vendor": f"Vendor {i % 500}", "expense_category": f"Category {i % 25}"})
+        rule_list.append(rule_dict)
+    return rule_list